@@ -24,38 +24,113 @@
 # (with Bearer header) sent to the server for future endpoint requests.
 
 from auth.jwt_handler import verify_access_token
+from decouple import config
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from piccolo.apps.user.tables import BaseUser
+from planner import metrics
+from planner.cache import TTLCache
+from planner.timing import measure
 
 
 # Tells the application that a security scheme is present
 oauth_scheme = OAuth2PasswordBearer(tokenUrl="/user/signin")
 
+# Active users (see `authenticate()` docstring)
+ACTIVE_TTL = config("AUTH_ACTIVE_TTL", default=60, cast=float) # seconds
+ACTIVE_USERS = config("AUTH_ACTIVE_USERS", default=10000, cast=int) # max entries
+
+active_users = TTLCache(maxsize=ACTIVE_USERS, ttl=ACTIVE_TTL)
+metrics.watch_cache("active_users", active_users)
+
+
 async def authenticate(token: str = Depends(oauth_scheme)) -> int:
     """Authenticate user by verifying JWT access token.
     
-    > Returns the payload data if decoded token is valid.
+    > Returns the user `id` if decoded token is valid.
     > Previously returned the `username` (not the `id`)!
 
     It's debatable about the best way to store user info in the JWT and
     retrieve user details for use in routes: this is one example. You might
     also want to retrieve other details you can use within authenticated
     endpoints, such as `@email` or `is_admin` status.
+
+    No database lookup
+    ------------------
+    > Our JWT is signed, so the `uid` claim can be trusted (see `jwt_handler`).
+
+    We used to `BaseUser.select()` the user on EVERY protected request, which
+    added a read to every write (the exact path that fights for the SQLite lock).
+    Tokens issued before the `uid` claim existed must sign in again.
+
+    Deactivated users
+    -----------------
+    > A signed token is valid until it expires, even if we ban the user!
+
+    We keep a small cache of `{ user_id: active }` which is re-checked every
+    `AUTH_ACTIVE_TTL` seconds, so a deactivated user is locked out within that
+    window (one cheap lookup per user, per window). Use `revoke_user()` to lock
+    them out of this process straight away.
+    """
+    with measure("auth"): # `Server-Timing` (see `planner/timing.py`)
+        if not token:
+            raise HTTPException(
+                status_code=403,
+                detail="Sign in for access"
+            )
+    
+        decoded_token = verify_access_token(token) # check validity of token
+        user_id = decoded_token.get("uid")
+
+        if not isinstance(user_id, int):
+            raise HTTPException(
+                status_code=403,
+                detail="Token is out of date, please sign in again"
+            )
+
+        active = active_users.get(user_id)
+
+        if active is None:
+            user = await (
+                BaseUser.select(BaseUser.active)
+                .where(BaseUser.id == user_id)
+                .first()
+            )
+            active = bool(user and user["active"])
+            active_users.set(user_id, active)
+
+        if not active:
+            raise HTTPException(
+                status_code=403,
+                detail="Account is not active"
+            )
+
+        return user_id
+
+
+async def authenticate_admin(user_id: int = Depends(authenticate)) -> int:
+    """Same as `authenticate()`, but only for `BaseUser.admin` users.
+
+    > This one DOES look the user up every time (admin routes are rare, and we
+    > want a demoted admin locked out straight away).
     """
-    if not token:
+    admin = await (
+        BaseUser.exists()
+        .where((BaseUser.id == user_id) & BaseUser.admin.eq(True))
+    )
+
+    if not admin:
         raise HTTPException(
             status_code=403,
-            detail="Sign in for access"
+            detail="Admins only"
         )
-    
-    decoded_token = verify_access_token(token) # check validity of token
 
-    user = await (
-        BaseUser.select()
-        .where(
-            BaseUser.username == decoded_token["sub"] # was `user`
-        ).first()
-    )
+    return user_id
 
-    return user["id"]
+
+def revoke_user(user_id: int):
+    """Reject a user's tokens (in this process) without waiting for the TTL.
+
+    > Also set `BaseUser.active = False` so other workers follow suit!
+    """
+    active_users.set(user_id, False)
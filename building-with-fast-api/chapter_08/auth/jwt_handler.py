@@ -11,8 +11,8 @@
 # 
 # JWT
 # ---
-# > A JWT is an encoded string usually containing a dictionary. For now, ONLY
-# > use as authentication (not to save database calls for user info).
+# > A JWT is an encoded string usually containing a dictionary. Use it for
+# > authentication, and the user `id` only (not for other user info).
 #
 # 1. A payload (dict containing values to be encoded)
 # 2. A signature (key used to sign the payload)
@@ -87,6 +87,10 @@
 # and get their details from the database. This might be their preferences, the
 # user type (admin/regular), etc.
 #
+# We also add the user's `id` as a `"uid"` claim. The token is signed, so this
+# can't be tampered with, and `authenticate()` no longer needs a database lookup
+# on every request to find it.
+#
 #
 # Understanding Time
 # ------------------
@@ -109,7 +113,7 @@ from jose import jwt, JWTError
 import time
 
 
-def create_access_token(username: str) -> str:
+def create_access_token(username: str, user_id: int) -> str:
     """Base64 url-encoded string with three parts
     
     > Encodes user info securely.
@@ -123,6 +127,7 @@ def create_access_token(username: str) -> str:
         # "iss": "https://stringoruri.com",
         # "aud": "https://stringoruri.com",
         "sub": username, # Was called `user` (must be a string)
+        "uid": user_id, # `BaseUser.id` (saves a lookup in `authenticate()`)
         "exp": time.time() + 3600 # 60sec * 60min = 1 hour
     }
     
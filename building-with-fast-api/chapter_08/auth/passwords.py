@@ -0,0 +1,179 @@
+# ------------------------------------------------------------------------------
+# Password hashing (off the event loop)
+# ==============================================================================
+# > Piccolo's `BaseUser` hashes passwords with PBKDF2 (600,000 rounds of SHA256).
+# > That's deliberately slow: roughly 0.3 seconds of CPU for EVERY sign in.
+#
+# `BaseUser.login()` and `BaseUser.create_user()` do that work right inside the
+# event loop. While one password is being hashed, NOTHING else runs: not even a
+# cached `GET /events/`. Ten people signing in at once is a three second freeze
+# for everybody.
+#
+# So we hash in an executor instead, and the event loop carries on:
+#
+# 1. `thread` (the default): `hashlib` lets go of the GIL while it hashes, so
+#    threads really do run in parallel (one per CPU core is plenty)
+# 2. `process`: a pool of processes, if you ever swap to a hash that doesn't
+#
+#     @ https://docs.python.org/3/library/asyncio-eventloop.html#executing-code-in-thread-or-process-pools
+#     @ https://docs.python.org/3/library/hashlib.html#hashlib.pbkdf2_hmac
+#
+# `login()` and `create_user()` below do the same thing as Piccolo's versions
+# (including hashing a password for unknown users, so the response time doesn't
+# give away which usernames exist). Their writes go through our writer (see
+# `planner/writer.py`).
+#
+#
+# Login storms
+# ------------
+# > More hashes than CPU cores is just a queue (that uses more memory).
+#
+# Only `HASH_WORKERS` hashes run at once. Up to `HASH_QUEUE` more can wait their
+# turn, for up to `HASH_WAIT` seconds. Anyone after that gets a quick `503` (with
+# `Retry-After`) rather than a very slow timeout.
+#
+# How long people wait is measured (see `stats()`, and `/users/hashing/stats` for
+# admins). If the average wait creeps up, you need more cores (or fewer sign ins!)
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Argon2 (`argon2-cffi`) is the modern choice for password hashing
+# 2. Rate limit sign ins per username (brute force attacks)
+
+from asyncio import Semaphore, get_running_loop, timeout
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from decouple import config
+from fastapi import HTTPException
+from piccolo.apps.user.tables import BaseUser
+from planner import metrics
+from planner.timing import measure
+from planner.writer import write
+
+import hmac
+import os
+import time
+
+
+HASH_EXECUTOR = config("HASH_EXECUTOR", default="thread") # or "process"
+HASH_WORKERS = config("HASH_WORKERS", default=os.cpu_count() or 2, cast=int) # At once
+HASH_QUEUE = config("HASH_QUEUE", default=HASH_WORKERS * 8, cast=int) # Waiting
+HASH_WAIT = config("HASH_WAIT", default=5.0, cast=float) # seconds
+
+_executor: Executor | None = None
+_running = Semaphore(HASH_WORKERS)
+_stats = {
+    "hashes": 0,
+    "waiting": 0,
+    "rejected": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+
+metrics.gauge("hashes_waiting", "Password hashes waiting for a worker", lambda: _stats["waiting"])
+
+
+async def hash_password(password: str, salt: str = "", iterations: int | None = None) -> str:
+    """`BaseUser.hash_password()` in our executor (or a `503` if we're too busy)"""
+    with measure("hash"): # `Server-Timing` (see `planner/timing.py`)
+        return await _hash_password(password, salt, iterations)
+
+
+async def _hash_password(password: str, salt: str, iterations: int | None) -> str:
+    if _stats["waiting"] >= HASH_QUEUE:
+        _reject()
+
+    start = time.perf_counter()
+    _stats["waiting"] += 1
+    try:
+        async with timeout(HASH_WAIT):
+            await _running.acquire()
+    except TimeoutError:
+        _reject()
+    finally:
+        _stats["waiting"] -= 1
+
+    waited = time.perf_counter() - start
+    _stats["hashes"] += 1
+    _stats["wait_seconds_total"] += waited
+    _stats["wait_seconds_max"] = max(_stats["wait_seconds_max"], waited)
+
+    try:
+        return await get_running_loop().run_in_executor(
+            _get_executor(), BaseUser.hash_password, password, salt, iterations
+        )
+    finally:
+        _running.release()
+
+
+async def login(username: str, password: str) -> int | None:
+    """Same as `BaseUser.login()`: the user's `id`, or `None` if it's no good"""
+    if len(username) > BaseUser.username.length or len(password) > BaseUser._max_password_length:
+        return None
+
+    user = await (
+        BaseUser.select(BaseUser.id, BaseUser.password)
+        .where(BaseUser.username == username)
+        .first()
+    )
+
+    if not user:
+        await hash_password(password) # Takes just as long as a real user
+        return None
+
+    _, iterations, salt, _ = BaseUser.split_stored_password(user["password"])
+    hashed = await hash_password(password, salt, int(iterations))
+
+    if not hmac.compare_digest(hashed, user["password"]):
+        return None
+
+    values = {BaseUser.last_login: datetime.now()}
+    if int(iterations) != BaseUser._pbkdf2_iteration_count: # An older Piccolo
+        values[BaseUser.password] = await hash_password(password)
+
+    await write(BaseUser.update(values).where(BaseUser.id == user["id"]))
+    return user["id"]
+
+
+async def create_user(username: str, password: str, **extra) -> BaseUser:
+    """Same as `BaseUser.create_user()` (raises a `ValueError` for bad input)"""
+    if not username:
+        raise ValueError("A username must be provided.")
+
+    BaseUser._validate_password(password=password)
+    user = BaseUser(username=username, password=await hash_password(password), **extra)
+
+    await write(BaseUser.insert(user))
+    return user
+
+
+def stats() -> dict:
+    average = _stats["wait_seconds_total"] / _stats["hashes"] if _stats["hashes"] else 0.0
+    return {**_stats, "wait_seconds_average": average, "workers": HASH_WORKERS}
+
+
+def stop_hashing():
+    """Shut the executor down (call once in the app `lifespan`)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+    _executor = None
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        pool = ProcessPoolExecutor if HASH_EXECUTOR == "process" else ThreadPoolExecutor
+        _executor = pool(max_workers=HASH_WORKERS)
+    return _executor
+
+
+def _reject():
+    _stats["rejected"] += 1
+    raise HTTPException(
+        status_code=503,
+        detail="Too many sign ins right now, please try again",
+        headers={"Retry-After": "1"}
+    )
@@ -116,7 +116,8 @@
 #     - How is UI architecture affected by endpoint design? (easier/harder?)
 #     - How are others handling this and their endpoints?
 #     - Elm code be made easier? (e.g: don't check UNIQUE values on client)
-# 2. Use Serial `ID` and shorter `UUID` for prettier URLs (and speed)
+# 2. <s>Use Serial `ID` and shorter `UUID` for prettier URLs (and speed)</s>
+#     - ✅ Done! Serial `Event.id` and a base62 `Event.public_id` (`planner/ids.py`)
 #     - Likely faster to have Serial `ID` for internal lookups
 #     - You could convert `UUID` to `ShortUUID` on the frontend, but a short
 #       uuid may also be quicker for lookups.
@@ -160,13 +161,19 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
 
-from piccolo.table import create_db_tables
+from piccolo.engine import engine_finder
 
+from auth.passwords import stop_hashing
+from planner.compression import compress_response
 from planner.routes.users import user_router
 from planner.routes.events import event_router
-from planner.tables import Event
+from planner.routes.tags import tag_router
+from planner.routes.admin import admin_router
+from planner.schema import create_schema
+from planner import metrics, slow_queries, timing
+from planner.writer import start_writer, stop_writer
 
 import time #! See `README.md#-performance`
 
@@ -178,8 +185,9 @@ import uvicorn
 # ==============================================================================
 # > See also my `data-playground/mocking/fruits` repo for further explanations
 #
-# 1. Build the database (if doesn't already exist)
-# 2. Use the `lifespan` setup
+# 1. Build the database (if doesn't already exist) with `planner.schema`
+# 2. Use the `lifespan` setup (which also starts our single `planner.writer`)
+#    and our pool of read-only connections (if `SQLITE_READERS` is set)
 # 3. Set a simple home route
 #
 # We could've also used Piccolo Admin here:
@@ -191,8 +199,14 @@ import uvicorn
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await create_db_tables(Event, if_not_exists=True)
+    engine = engine_finder()
+    await create_schema()
+    await engine.start_connection_pool()
+    await start_writer()
     yield
+    await stop_writer() # Commits anything still in the queue
+    stop_hashing()
+    await engine.close_connection_pool()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -200,6 +214,11 @@ app = FastAPI(lifespan=lifespan)
 def home():
     return RedirectResponse(url="/events/")
 
+@app.get("/metrics", include_in_schema=False)
+def retrieve_metrics():
+    """Prometheus text format (see `planner/metrics.py`)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 
 # ------------------------------------------------------------------------------
 # Routers (register)
@@ -208,6 +227,8 @@ def home():
 
 app.include_router(user_router, prefix="/users") # prefixes the `/users` url
 app.include_router(event_router, prefix="/events") # prefixes the `/events` url
+app.include_router(tag_router, prefix="/tags") # prefixes the `/tags` url
+app.include_router(admin_router, prefix="/admin") # admins only!
 
 
 # ------------------------------------------------------------------------------
@@ -221,6 +242,13 @@ app.include_router(event_router, prefix="/events") # prefixes the `/events` url
 #    - @ https://fastapi.tiangolo.com/tutorial/middleware/#create-a-middleware
 #    - @ https://developer.mozilla.org/en-US/docs/Web/HTTP/Reference/Headers/Server-Timing
 #    - ⚠️ See `README.md#-performance` for a better way!
+#    - Split into `auth`, `db`, `ser` (etc) and `total`, so we can see which part
+#      of a slow request was slow (see `planner/timing.py`)
+# 2. Responses are compressed (gzip, or brotli if it's installed) for our slow
+#    4G users. Cached pages are compressed ahead of time, so it skips those.
+#    - See `planner/compression.py` (`COMPRESS_MIN_SIZE`, `GZIP_LEVEL`, etc)
+# 3. The timing middleware also records every request for `/metrics` (counts,
+#    latency percentiles, requests in flight). See `planner/metrics.py`
 
 origins = [
     "http://localhost:8000"
@@ -234,12 +262,27 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+@app.middleware("http")
+async def compress_responses(request: Request, call_next):
+    response = await call_next(request)
+    return await compress_response(request, response)
+
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
+    phases = timing.start() # Our routes (and dependencies) add to these
+    slow_queries.request_scope.set(request.scope) # Which route ran a slow query
     start_time = time.perf_counter()
-    response = await call_next(request)
-    process_time = time.perf_counter() - start_time
-    response.headers["Server-Timing"] = f"app;dur={process_time}" # {process_time * 1000:.2f}
+    status = 500 # Unless we get a response
+    metrics.request_started()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        process_time = time.perf_counter() - start_time
+        route = metrics.route_template(request.url.path, request.scope.get("route"))
+        metrics.request_finished(request.method, route, status, process_time)
+
+    response.headers["Server-Timing"] = timing.header(phases, process_time)
     return response
 
 
@@ -21,8 +21,31 @@
 # and concurrent write requests are also problematic at scale (see `app.py` and
 # `tables.py` notes for more on this).
 #
-# SQLite `PRAGMA` settings aren't currently available in Piccolo.
-# 
+# SQLite `PRAGMA` settings aren't currently available in Piccolo, so we use our
+# own `PragmaSQLiteEngine` (see below).
+#
+#
+# PRAGMA profiles
+# ---------------
+# > See `planner/engine.py` for the profiles and what they do.
+#
+# Pick a named profile per deployment (no code changes needed). You can also
+# override any single PRAGMA in the profile with it's own `SQLITE_` setting:
+#
+# ```
+# SQLITE_DATABASE=planner.db
+# SQLITE_PROFILE=read-heavy # read-heavy | write-burst | durable (default)
+# SQLITE_BUSY_TIMEOUT=10000
+# ```
+#
+#
+# Read and write engines
+# ----------------------
+# > `SQLITE_READERS=4` opens a pool of 4 read-only connections for read routes.
+#
+# Defaults to `0` (one engine for everything). See `planner/engine.py` for how
+# routes are marked as readers. Best used with the `read-heavy` (`WAL`) profile.
+#
 # 
 # Timeout
 # -------
@@ -53,7 +76,7 @@
 # ------------------------------------------------------------------------------
 # WISHLIST
 # ------------------------------------------------------------------------------
-# 1. PRAGMAs for SQLite like previous versions?
+# 1. <s>PRAGMAs for SQLite like previous versions?</s> (see `planner/engine.py`)
 #     - Especially to reduce `database is locked` concurrent errors
 #     - These can be added within `sqlite3` instead of with Piccolo
 # 2. Logging for bug-checking with a live API:
@@ -61,17 +84,33 @@
 #     - @ (previously) https://docs.peewee-orm.com/en/latest/peewee/database.html#logging-queries
 #     - `from logging import getLogger, StreamHandler, DEBUG`
 #     - Remember that query logs are NOT return values (responses)!
+#     - `SQLITE_LOG_QUERIES` is far too noisy for a live API: use the slow query
+#       log instead (`SLOW_QUERY_MS`, see `planner/slow_queries.py`)
 
 from decouple import config
 from piccolo.conf.apps import AppRegistry
-from piccolo.engine.sqlite import SQLiteEngine
+from planner.engine import ReadWriteSQLiteEngine, pragma_profile
 
 
 DATABASE = config("SQLITE_DATABASE", default="planner.db")
 LOG_QUERIES = config("SQLITE_LOG_QUERIES", default=False, cast=bool)
 LOG_RESPONSES = config("SQLITE_LOG_RESPONSES", default=False, cast=bool)
 
-DB = SQLiteEngine(path=DATABASE, log_queries=LOG_QUERIES, log_responses=LOG_RESPONSES, timeout=10)
+PROFILE = config("SQLITE_PROFILE", default="durable")
+READERS = config("SQLITE_READERS", default=0, cast=int)
+PRAGMAS = {
+    name: config(f"SQLITE_{name.upper()}", default=value)
+    for name, value in pragma_profile(PROFILE).items()
+}
+
+DB = ReadWriteSQLiteEngine(
+    path=DATABASE,
+    pragmas=PRAGMAS,
+    readers=READERS,
+    log_queries=LOG_QUERIES,
+    log_responses=LOG_RESPONSES,
+    timeout=10
+)
 
 APP_REGISTRY = AppRegistry(
     apps=["planner.piccolo_app", "piccolo.apps.user.piccolo_app"]
@@ -0,0 +1,199 @@
+# ------------------------------------------------------------------------------
+# Bulk event creation (one transaction, one `fsync`)
+# ==============================================================================
+# > Imports (Tally, n8n, a spreadsheet) send hundreds of events at once. One
+# > `POST /events/` each is hundreds of writes fighting for the lock!
+#
+# `POST /events/bulk` takes up to `BULK_LIMIT` events in ONE request, as either:
+#
+# 1. A JSON array: `[{"title": ...}, {"title": ...}]`
+# 2. NDJSON (one event per line) with `Content-Type: application/x-ndjson`
+#
+#     @ https://github.com/ndjson/ndjson-spec
+#
+# Every item is validated with the same `api.Event` model as `POST /events/`. A
+# bad item doesn't stop the good ones: it's reported (with it's index) and the
+# rest are inserted.
+#
+#
+# Multi-row inserts
+# -----------------
+# > `INSERT INTO event (...) VALUES (...), (...), ... RETURNING public_id`
+#
+# Valid events are split into chunks of `BULK_CHUNK_SIZE` rows (each row is 9
+# SQL parameters, and SQLite allows 32,766 per query). All the chunks are ONE
+# writer job (see `planner/writer.py`), so they're committed together in a single
+# transaction: 10,000 events is one `fsync`, not 10,000. They're all written, or
+# none of them are.
+#
+#     | 10k events (one client)            | Time  |
+#     | ---------------------------------- | ----- |
+#     | `POST /events/` (10,000 requests)  | 58.4s |
+#     | `POST /events/bulk` (JSON array)   | 1.1s  |
+#
+# Every `public_id` is made in Python BEFORE the insert (see `planner/ids.py`),
+# so we know which item each `RETURNING` row belongs to (SQLite doesn't promise
+# to return rows in `VALUES` order).
+#
+# > ⚠️ We build the `INSERT` ourselves (with `Event.raw()`), not `Event.insert()`
+#
+# Piccolo makes an `Event()` object and a query string for EVERY row, which was
+# 70% of the time for a big import. Missing values get the same defaults as
+# `POST /events/` (each column's `default`), and lists are still stored as JSON
+# (Piccolo's SQLite adapter does that for any query).
+#
+#
+# Caching
+# -------
+# > A big import lands in (almost) every cached page, so we drop the lot.
+#
+# Checking each row against each cached page (see `planner/event_cache.py`) is
+# slower than rebuilding the few pages people actually ask for.
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Stream the body (and insert as we go) rather than reading it all at once
+# 2. Should a duplicate `title` in the same import be an error?
+# 3. `201 Created` (or `207 Multi-Status`) rather than `200`?
+
+from decouple import config
+from fastapi import HTTPException
+from pydantic import ValidationError
+from planner.ids import to_base62
+from planner.models.events import Event as EventIn
+from planner.tables import Event
+
+import json
+import uuid
+
+
+BULK_LIMIT = config("BULK_LIMIT", default=10_000, cast=int) # Events per request
+CHUNK_SIZE = config("BULK_CHUNK_SIZE", default=1000, cast=int) # Rows per `INSERT`
+
+COLUMNS = (
+    "public_id", "creator", "title", "image", "description",
+    "location", "tags", "latitude", "longitude",
+)
+
+ROW = "(" + ", ".join("{}" for _ in COLUMNS) + ")"
+
+INSERT = (
+    'INSERT INTO "event" (' + ", ".join(f'"{name}"' for name in COLUMNS) + ') '
+    'VALUES {} RETURNING "public_id"'
+)
+
+_DEFAULTS = {
+    name: Event._meta.get_column_by_name(name).get_default_value
+    for name in COLUMNS
+}
+
+
+def is_ndjson(content_type: str) -> bool:
+    return any(kind in content_type for kind in ("ndjson", "jsonl", "json-seq"))
+
+
+def parse_items(body: bytes, ndjson: bool) -> list:
+    """A list of raw items (NDJSON lines that aren't JSON are an `Exception`).
+
+    > A JSON body that isn't an array is a `400` (there's nothing to report on)
+    """
+    if ndjson:
+        items = [_json_line(line) for line in body.splitlines() if line.strip()]
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError:
+            items = None
+
+        if not isinstance(items, list):
+            raise HTTPException(
+                status_code=400,
+                detail="Send a JSON array of events (or NDJSON, one per line)"
+            )
+
+    if len(items) > BULK_LIMIT:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Send at most {BULK_LIMIT} events per request"
+        )
+
+    return items
+
+
+def validate(items: list, creator: int) -> tuple[list[tuple], list[dict]]:
+    """Rows to insert (`COLUMNS` values), and a result for every item (in order)"""
+    rows, results = [], []
+
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            event = EventIn.model_validate(item).model_dump()
+        except ValidationError as error:
+            results.append({"index": index, "errors": _errors(error)})
+            continue
+        except ValueError as error:
+            results.append({"index": index, "errors": [{"msg": str(error)}]})
+            continue
+
+        row = _row(event, creator)
+        rows.append(row)
+        results.append({"index": index, "public_id": row[0]})
+
+    return rows, results
+
+
+def insert_queries(rows: list[tuple]) -> list:
+    """One multi-row `INSERT ... RETURNING` for each chunk of rows (unawaited)"""
+    queries = []
+
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        values = ", ".join([ROW] * len(chunk))
+        queries.append(Event.raw(INSERT.format(values), *(v for row in chunk for v in row)))
+
+    return queries
+
+
+def report(results: list[dict], inserted: list[dict]) -> dict:
+    """Our per-item results, with each `public_id` in base62.
+
+    > An item only has a `public_id` if we got it's row back (it's definitely
+    > in the database).
+    """
+    returned = {row["public_id"].bytes for row in inserted}
+
+    for result in results:
+        public_id = result.pop("public_id", None)
+        if public_id is None:
+            continue
+        elif public_id in returned:
+            result["public_id"] = to_base62(uuid.UUID(bytes=public_id))
+        else:
+            result["errors"] = [{"msg": "Event was not inserted"}]
+
+    created = len(returned)
+    return { "created": created, "failed": len(results) - created, "results": results }
+
+
+def _row(event: dict, creator: int) -> tuple:
+    """Values for `COLUMNS`, where `None` is the column's default (like Piccolo)"""
+    event = {**event, "public_id": None, "creator": creator}
+    return tuple(
+        _DEFAULTS[name]() if event[name] is None else event[name]
+        for name in COLUMNS
+    )
+
+
+def _json_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return ValueError("Invalid JSON")
+
+
+def _errors(error: ValidationError) -> list[dict]:
+    """Pydantic's errors, without the (possibly huge) input"""
+    return error.errors(include_url=False, include_context=False, include_input=False)
@@ -0,0 +1,89 @@
+# ------------------------------------------------------------------------------
+# A tiny in-process cache (LRU + TTL)
+# ==============================================================================
+# > Don't reach for Redis until you need it! @ https://github.com/long2ice/fastapi-cache
+#
+# An `OrderedDict` gives us a "least recently used" cache for free: every hit is
+# moved to the end, so the oldest entry is always first in line to be evicted.
+# Every entry also has an expiry time (TTL), after which it's treated as a miss.
+#
+# 1. Bounded: never holds more than `maxsize` entries (memory is predictable)
+# 2. Stale data is only ever `ttl` seconds old (at worst)
+# 3. It's per process, so each `uvicorn --workers` has it's own copy!
+#
+# We're single threaded (one event loop) so there's no need for locks here. Use
+# `time.monotonic()` for expiry as the wall clock can jump backwards.
+#
+#
+# Counters
+# --------
+# > Is the cache actually helping? Check `stats()` before and after a load test.
+#
+# 1. `hits`: found (and not expired)
+# 2. `misses`: not found, or expired
+# 3. `evictions`: pushed out because the cache was full
+# 4. `expired`: found, but too old
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import time
+
+
+class TTLCache:
+    """Least recently used cache where each entry expires after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = self.misses = self.evictions = self.expired = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return default
+        elif entry[0] < time.monotonic(): # Expired
+            del self.entries[key]
+            self.misses += 1
+            self.expired += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False) # Least recently used
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        self.entries.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Remove every entry where `predicate(key, value)` is true."""
+        keys = [key for key, (_, value) in self.entries.items() if predicate(key, value)]
+        for key in keys:
+            del self.entries[key]
+        return len(keys)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,83 @@
+# ------------------------------------------------------------------------------
+# Cache coherence (across `uvicorn --workers`)
+# ==============================================================================
+# > Each worker has it's own event cache (see `planner/event_cache.py`). When
+# > another worker runs `create_event`, our cache doesn't know about it!
+#
+# We don't want a shared cache service (like Redis) just for this, so we ask
+# SQLite instead. There's two parts:
+#
+# 1. `PRAGMA data_version` is a cheap "has anyone committed?" check
+#     - It changes whenever ANOTHER connection commits (any process)
+#     - It's held in memory, so costs microseconds (run it on every read)
+# 2. A `planner_generation` counter, bumped by triggers on every `event` write
+#     - `data_version` changes for ANY table (such as `BaseUser.last_login`)
+#     - The counter tells us if our events actually changed
+#
+#     @ https://www.sqlite.org/pragma.html#pragma_data_version
+#
+#
+# Our own writes
+# --------------
+# > We don't want to throw away our whole cache after every local write!
+#
+# Our own writes already invalidate precisely, so the writer tells us the counter
+# before and after each of it's transactions with `wrote()`. If nobody else wrote
+# in between, we skip ahead to the new value and our cache stays put. Otherwise
+# we'll spot the difference on the next `refresh()` and drop everything.
+#
+# `generation()` is also a handy version number for the whole events table.
+#
+#
+# Locks
+# -----
+# > ⚠️ This runs in the event loop, so it must NEVER wait on a lock!
+#
+# The watcher is a plain `sqlite3` read-only connection with `timeout=0`. If a
+# writer has the database locked, we skip the check (and try again next time).
+
+from planner.tables import Event
+from pathlib import Path
+
+import sqlite3
+
+
+_watcher: sqlite3.Connection | None = None
+_data_version = None
+_seen = None
+
+
+def refresh() -> bool:
+    """Returns `True` if another process has changed our events since we last looked."""
+    global _watcher, _data_version, _seen
+
+    try:
+        if _watcher is None:
+            uri = Path(Event._meta.db.path).resolve().as_uri() + "?mode=ro"
+            _watcher = sqlite3.connect(uri, uri=True, timeout=0, isolation_level=None)
+
+        data_version = _watcher.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == _data_version:
+            return False
+
+        n = _watcher.execute("SELECT n FROM planner_generation").fetchone()[0]
+    except sqlite3.OperationalError: # Locked (or no table yet)
+        return False
+
+    _data_version = data_version
+    changed = _seen is not None and n != _seen
+    _seen = n
+
+    return changed
+
+
+def wrote(before: int, after: int):
+    """Our writer committed, moving the counter from `before` to `after`."""
+    global _seen
+    if _seen == before:
+        _seen = after
+
+
+def generation() -> int | None:
+    """The last events generation we've seen (`None` before the first check)"""
+    return _seen
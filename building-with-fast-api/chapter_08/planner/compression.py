@@ -0,0 +1,170 @@
+# ------------------------------------------------------------------------------
+# Response compression (gzip and brotli)
+# ==============================================================================
+# > "Have you compressed data as much as possible?" (see `PROBLEM.md`)
+# > @ https://developer.mozilla.org/en-US/docs/Web/HTTP/Guides/Compression
+#
+# A page of 20 events is mostly repeated field names and similar descriptions,
+# so it compresses really well. On slow 4G, fewer bytes is a faster page:
+#
+#     | A page of 20 events     | Bytes  |
+#     | ----------------------- | ------ |
+#     | Plain JSON              | 13,288 |
+#     | gzip (level 6)          | 656    |
+#
+# (Our test events all have the same description, so real pages won't shrink
+# quite that much.) Brotli is usually a little smaller again than gzip.
+#
+# The client says what it can read with `Accept-Encoding: gzip, br` and we pick
+# the best one (brotli, then gzip), respecting any `;q=0`. Small responses (under
+# `COMPRESS_MIN_SIZE` bytes) aren't worth it, and are sent as they are.
+#
+#     @ https://www.rfc-editor.org/rfc/rfc9110#name-accept-encoding
+#
+#
+# Two places we compress
+# ----------------------
+# > Compressing is CPU work, so never do the same work twice.
+#
+# 1. Cached pages and events (see `planner/event_cache.py`) keep their compressed
+#    bytes next to the JSON, so a hot page is compressed once per encoding, not
+#    once per request (see `cached()`)
+# 2. Everything else goes through the `compress_responses` middleware (see
+#    `main.py`), which leaves anything that's already compressed alone
+#
+# Streaming responses (like `/events/export`) aren't compressed: we'd have to
+# read the whole thing first, which is the opposite of streaming.
+#
+#
+# ETags
+# -----
+# > A strong `ETag` means "byte for byte the same", and gzip bytes aren't!
+#
+# So a compressed response gets a WEAK version of it's `ETag` (the same as nginx
+# does). `If-None-Match` uses weak comparison anyway (see `planner/etags.py`),
+# so `304`s still work whichever encoding the client asks for.
+#
+#
+# Brotli
+# ------
+# > It's optional! Without the `brotli` package we only offer gzip.
+#
+# ```
+# uv add brotli
+# ```
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. `zstd` (Python 3.14 has `compression.zstd` built in)
+# 2. Compress streaming exports chunk by chunk (`zlib.compressobj()`)
+
+from decouple import config
+from planner.timing import measure
+from starlette.requests import Request
+from starlette.responses import Response
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MIN_SIZE = config("COMPRESS_MIN_SIZE", default=500, cast=int) # bytes
+GZIP_LEVEL = config("GZIP_LEVEL", default=6, cast=int) # 1 (fast) to 9 (small)
+BROTLI_QUALITY = config("BROTLI_QUALITY", default=5, cast=int) # 0 (fast) to 11 (small)
+
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",) # Best first
+
+COMPRESSIBLE = ("application/json", "text/")
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """The best encoding the client accepts (or `None` for plain bytes)"""
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            accepted[name.strip().lower()] = float(quality) if quality else 1.0
+        except ValueError:
+            continue
+
+    wildcard = accepted.get("*", 0.0)
+    return next(
+        (name for name in ENCODINGS if accepted.get(name, wildcard) > 0), None
+    )
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    with measure(encoding): # `Server-Timing` (see `planner/timing.py`)
+        if encoding == "br":
+            return brotli.compress(body, quality=BROTLI_QUALITY)
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def choose(body: bytes, accept_encoding: str | None) -> str | None:
+    """`negotiate()`, unless the body is too small to bother"""
+    return None if len(body) < MIN_SIZE else negotiate(accept_encoding)
+
+
+def cached(entry: dict, encoding: str | None) -> bytes:
+    """A cache entry's bytes in this encoding (compressed the first time only)
+
+    > Kept as `entry["gzip"]` etc. It's dropped with the entry, so never stale.
+    """
+    if encoding is None:
+        return entry["value"]
+
+    if encoding not in entry:
+        entry[encoding] = compress(entry["value"], encoding)
+
+    return entry[encoding]
+
+
+def etag(value: str | None, encoding: str | None) -> str | None:
+    """Compressed bytes get a weak `ETag` (see "ETags" above)"""
+    if value is None or encoding is None or value.startswith("W/"):
+        return value
+    return "W/" + value
+
+
+async def compress_response(request: Request, response: Response) -> Response:
+    """Compress a (non-streaming) response, if it's worth it"""
+    headers = response.headers
+    media_type = headers.get("content-type", "")
+
+    if (
+        "content-encoding" in headers
+        or "content-length" not in headers # Streaming
+        or int(headers["content-length"]) < MIN_SIZE
+        or not media_type.startswith(COMPRESSIBLE)
+    ):
+        return response
+
+    encoding = negotiate(request.headers.get("accept-encoding"))
+
+    if encoding is None:
+        response.headers.append("Vary", "Accept-Encoding")
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    compressed = Response(content=compress(body, encoding), status_code=response.status_code)
+    compressed.raw_headers = [
+        *((name, value) for name, value in response.raw_headers if name not in (b"content-length", b"etag")),
+        *compressed.raw_headers, # The new `content-length`
+    ]
+
+    compressed.headers["Content-Encoding"] = encoding
+    compressed.headers.append("Vary", "Accept-Encoding")
+
+    if "etag" in headers:
+        compressed.headers["ETag"] = etag(headers["etag"], encoding)
+
+    return compressed
@@ -0,0 +1,126 @@
+# ------------------------------------------------------------------------------
+# Keyset (cursor) pagination
+# ==============================================================================
+# > Never use `OFFSET` for pagination: page 1,000 would scan 999 pages first!
+# > @ https://use-the-index-luke.com/no-offset
+#
+# A keyset cursor remembers the LAST row the client saw (it's sort value and the
+# `Event.id` tie-breaker), so the next page is a simple index seek:
+#
+# ```sql
+# SELECT ... WHERE ("title", "id") > ('Comic Con', 1042)
+# ORDER BY "title", "id" LIMIT 21
+# ```
+#
+# The cost of page N is the same as page 1. We need a composite index on each
+# sort order for this to work (see `planner/schema.py`).
+#
+#
+# Opaque cursors
+# --------------
+# > The client should never build (or read) a cursor itself!
+#
+# Cursors are url-safe base64 encoded JSON: `[sort, value, id]`. It's NOT signed
+# or encrypted, so never put anything sensitive in here. A tampered cursor can
+# only ever change where the page starts (values are passed as SQL parameters).
+#
+#
+# Null values
+# -----------
+# > SQLite sorts `NULL` first in ascending order.
+#
+# `Event.location` is nullable, and row values can't compare `NULL` (the result
+# is always `NULL`, so no rows are returned). We handle it with a special case.
+#
+#
+# IDs
+# ---
+# > `Event.id` is an integer (see `planner/ids.py`)
+#
+# The cursor holds the integer, and `keyset()` checks it still is one. A string
+# never compares equal to an integer in SQLite (it always sorts after), so a
+# tampered cursor would silently return the wrong page. `UUID7()` columns are
+# turned back into bytes, for the same reason.
+#
+# It's our private `Event.id`, but it's only readable if you decode the cursor
+# yourself (which you shouldn't!)
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from fastapi import HTTPException
+from piccolo.columns import Column, Serial
+from piccolo.columns.combination import WhereRaw
+from planner.ids import UUID7, parse_id
+
+import json
+
+
+def encode_cursor(sort: str, value, id) -> str:
+    """Encode the last row of a page into an opaque cursor string."""
+    raw = json.dumps([sort, value, id], separators=(",", ":"), default=str)
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(sort: str, cursor: str) -> tuple:
+    """Decode a cursor into `(value, id)` or raise a `400` bad request.
+
+    > A cursor is only valid for the sort order that created it!
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(urlsafe_b64decode(cursor + padding))
+    except (Base64Error, ValueError):
+        values = None
+
+    if not isinstance(values, list) or len(values) != 3 or values[0] != sort:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor for this query"
+        )
+
+    return values[1], values[2]
+
+
+def keyset(column: Column, id_column: Column, value, id) -> WhereRaw:
+    """Where clause for all rows AFTER `(value, id)` in ascending order.
+
+    > Row values let SQLite seek straight into the `(column, id)` index.
+
+    If we're sorting by the `id` alone, the `column` and `id_column` are the same.
+    """
+    name = _full_name(column)
+    id_name = _full_name(id_column)
+    value, id = _sql_value(column, value), _sql_value(id_column, id)
+
+    if name == id_name:
+        return WhereRaw(f"{id_name} > {{}}", id)
+    elif value is None:
+        return WhereRaw( # Bracketed, as Piccolo `AND`s it with any other `.where()`
+            f"(({name} IS NULL AND {id_name} > {{}}) OR {name} IS NOT NULL)", id
+        )
+    else:
+        return WhereRaw(f"({name}, {id_name}) > ({{}}, {{}})", value, id)
+
+
+def _sql_value(column: Column, value):
+    """`Serial()` columns need integers, and `UUID7()` columns need bytes"""
+    if isinstance(column, Serial):
+        parsed = value if type(value) is int else None
+    elif isinstance(column, UUID7):
+        parsed = parse_id(value)
+        parsed = None if parsed is None else parsed.bytes
+    else:
+        return value
+
+    if parsed is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor for this query"
+        )
+
+    return parsed
+
+
+def _full_name(column: Column) -> str:
+    """Quoted `"table"."column"` name (joins would make `"id"` ambiguous)"""
+    return f'"{column._meta.table._meta.tablename}"."{column._meta.db_column_name}"'
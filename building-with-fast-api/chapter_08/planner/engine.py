@@ -0,0 +1,292 @@
+# ------------------------------------------------------------------------------
+# SQLite engine with PRAGMA profiles
+# ==============================================================================
+# > Piccolo's `SQLiteEngine` only sets `PRAGMA foreign_keys = 1` for us.
+# > @ https://www.sqlite.org/pragma.html
+# > @ https://www.powersync.com/blog/sqlite-optimizations-for-ultra-high-performance
+#
+# Most PRAGMAs only last as long as the connection does, and Piccolo opens a new
+# connection for every query. So our engine runs the PRAGMAs on EVERY new
+# connection (in one `executescript` call, so it's a single trip to the thread).
+# Every connection also gets a Unicode `lower()` (see `planner/tags.py`).
+#
+# `journal_mode = WAL` is different: it's saved in the database file itself, and
+# changing in (or out) of it needs the database to ourselves. So it's set ONCE on
+# startup with `prep_database()` (see `planner/schema.py`). The rollback journal
+# modes (`DELETE`, `TRUNCATE`) only last per connection, so we set them on both.
+#
+#
+# Profiles
+# --------
+# > There's no "best" setting! Pick a profile per deployment with `.env`:
+#
+# ```
+# SQLITE_PROFILE=write-burst
+# SQLITE_CACHE_SIZE=-32000  # Override a single PRAGMA in the profile
+# ```
+#
+# `PERFORMANCE.md` shows `WAL` mode helps at `-c 75` and hurts at `-c 100`, so
+# we need to be able to switch without changing any code:
+#
+# 1. `read-heavy`: `WAL` (readers don't block the writer) and a big page cache
+# 2. `write-burst`: rollback journal (kept on disk) and fewer `fsync`s
+# 3. `durable`: SQLite defaults; every commit is safe on disk (our default)
+#
+# `synchronous = NORMAL` can lose the last few commits on power loss (but will
+# never corrupt the database). Only `durable` is safe against that.
+#
+#     @ https://www.sqlite.org/wal.html#performance_considerations
+#     @ https://www.sqlite.org/pragma.html#pragma_synchronous
+#
+#
+# Read and write engines
+# ----------------------
+# > `ReadWriteSQLiteEngine` adds a pool of read-only connections for reads.
+#
+# With one engine, a long `retrieve_all_events` queues up behind `create_event`
+# writes (and opens a brand new connection every time). In dual engine mode:
+#
+# 1. Reads use a pool of `SQLITE_READERS` connections that stay open
+#     - Opened with a `mode=ro` URI and `query_only`, so they CAN'T write
+#     - Each `aiosqlite` connection has it's own thread, so reads run in parallel
+#     - Their page cache stays warm between requests (a nice bonus)
+# 2. Writes use the normal engine (one connection at a time, see `planner/writer.py`)
+#
+# Readers only run alongside a writer in `WAL` mode (use the `read-heavy`
+# profile). In a rollback journal mode, readers still block writers.
+#
+#     @ https://www.sqlite.org/wal.html#concurrency
+#     @ https://www.sqlite.org/uri.html
+#
+#
+# Declaring read routes
+# ---------------------
+# > Queries use the WRITER unless a route (or router) says otherwise!
+#
+# ```
+# @router.get("/", dependencies=[Depends(use_reader)])  # A single route
+# APIRouter(dependencies=[Depends(use_reader)])         # A whole router
+# ```
+#
+# This is safer than guessing from the SQL: a route that reads then writes will
+# still work (it just gets `SQLITE_READONLY` errors if you mark it as a reader).
+# Transactions always use the writer.
+
+from asyncio import Queue
+from contextvars import ContextVar
+from pathlib import Path
+from piccolo.engine.sqlite import SQLiteEngine, dict_factory
+from piccolo.querystring import QueryString
+from planner import metrics, slow_queries
+from planner.tags import lower
+from planner.timing import measure
+
+import aiosqlite
+import re
+import time
+
+
+PROFILES = {
+    "read-heavy": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000, # 64MB (negative numbers are KiB)
+        "mmap_size": 268435456, # 256MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000, # milliseconds
+        "foreign_keys": "ON",
+    },
+    "write-burst": {
+        "journal_mode": "TRUNCATE",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+        "foreign_keys": "ON",
+    },
+    "durable": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 10000,
+        "foreign_keys": "ON",
+    },
+}
+
+PRAGMA_VALUE = re.compile(r"^-?[A-Za-z0-9_]+$") # Never trust config blindly!
+
+
+def pragma_profile(name: str) -> dict:
+    """Return a copy of the named PRAGMA profile (or raise a `ValueError`)"""
+    if name not in PROFILES:
+        raise ValueError(f"Unknown SQLite profile: {name} (try {', '.join(PROFILES)})")
+
+    return dict(PROFILES[name])
+
+
+class PragmaSQLiteEngine(SQLiteEngine):
+    """A Piccolo `SQLiteEngine` that applies our PRAGMAs to every connection.
+
+    > `pragmas` is a dict of `{ "name": value }`, usually a profile.
+    """
+
+    def __init__(self, path: str, pragmas: dict, **kwargs):
+        for name, value in pragmas.items():
+            if name not in PROFILES["durable"] or not PRAGMA_VALUE.match(str(value)):
+                raise ValueError(f"Invalid PRAGMA: {name} = {value}")
+
+        self.journal_mode = pragmas.get("journal_mode")
+        self.pragmas = "; ".join(
+            f"PRAGMA {name} = {value}"
+            for name, value in pragmas.items()
+            if not (name == "journal_mode" and str(value).upper() == "WAL")
+        )
+
+        super().__init__(path=path, **kwargs)
+
+    async def prep_database(self):
+        """Set the `journal_mode` on startup (`WAL` is saved in the database)"""
+        if self.journal_mode:
+            connection = await self.get_connection()
+            try:
+                await connection.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+            finally:
+                await connection.close()
+
+    async def get_connection(self) -> aiosqlite.Connection:
+        connection = await aiosqlite.connect(**self.connection_kwargs)
+        connection.row_factory = dict_factory # type: ignore
+        await connection.executescript(self.pragmas)
+        await connection.create_function("lower", 1, lower, deterministic=True)
+        return connection
+
+    async def _run_in_new_connection(
+        self,
+        query: str,
+        args: list | None = None,
+        query_type: str = "generic",
+        table=None,
+    ):
+        """Same as Piccolo's version, but with our connection PRAGMAs.
+
+        > We rely on `.returning()`, so SQLite 3.35+ is required anyway.
+        """
+        connection = await self.get_connection()
+        try:
+            async with connection.execute(query, args or []) as cursor:
+                await connection.commit()
+                return await cursor.fetchall()
+        finally:
+            await connection.close()
+
+
+# ------------------------------------------------------------------------------
+# Read and write engines
+# ==============================================================================
+
+role: ContextVar[str] = ContextVar("sqlite_role", default="write")
+
+
+async def use_reader():
+    """Route dependency: run this request's queries on the read-only pool."""
+    role.set("read")
+
+
+async def use_writer():
+    """Route dependency: run this request's queries on the writer (default)."""
+    role.set("write")
+
+
+class ReadWriteSQLiteEngine(PragmaSQLiteEngine):
+    """A `PragmaSQLiteEngine` with a pool of read-only connections.
+
+    > Start (and close) the pool in the app `lifespan`. With `readers=0` this
+    > is exactly the same as a `PragmaSQLiteEngine`.
+    """
+
+    def __init__(self, path: str, pragmas: dict, readers: int = 0, **kwargs):
+        super().__init__(path=path, pragmas=pragmas, **kwargs)
+        self.readers = readers
+        self.pool: Queue | None = None
+        self.read_pragmas = "; ".join(
+            [f"PRAGMA {name} = {value}" for name, value in pragmas.items()
+             if name != "journal_mode"] + ["PRAGMA query_only = ON"]
+        )
+
+    async def start_connection_pool(self, **kwargs):
+        """Open our read-only connections (does nothing if `readers=0`)"""
+        if self.readers < 1 or self.pool is not None:
+            return
+
+        uri = Path(self.path).resolve().as_uri() + "?mode=ro"
+        pool = Queue()
+
+        for _ in range(self.readers):
+            connection = await aiosqlite.connect(
+                **{**self.connection_kwargs, "database": uri, "uri": True}
+            )
+            connection.row_factory = dict_factory # type: ignore
+            await connection.executescript(self.read_pragmas)
+            await connection.create_function("lower", 1, lower, deterministic=True)
+            pool.put_nowait(connection)
+
+        self.pool = pool
+
+    async def close_connection_pool(self, **kwargs):
+        if self.pool is None:
+            return
+
+        pool, self.pool = self.pool, None
+        for _ in range(self.readers):
+            connection = await pool.get() # Waits for any running reads
+            await connection.close()
+
+    async def run_querystring(self, querystring: QueryString, in_pool: bool = False):
+        """Send the query to the read pool if this is a read route.
+
+        > Every query is timed as `db` (see `planner/timing.py`), busy errors are
+        > counted (see `planner/metrics.py`) and slow ones are logged (see
+        > `planner/slow_queries.py`)
+        """
+        with measure("db"):
+            start = time.perf_counter()
+            try:
+                if (
+                    self.pool is None
+                    or role.get() != "read"
+                    or self.current_transaction.get() is not None
+                ):
+                    response = await super().run_querystring(querystring, in_pool=in_pool)
+                else:
+                    response = await self._run_in_pool(querystring)
+            except Exception as error:
+                metrics.sqlite_error(error) # Counts `SQLITE_BUSY` for `/metrics`
+                raise
+
+            slow_queries.check(self, querystring, response, time.perf_counter() - start)
+            return response
+
+    async def _run_in_pool(self, querystring: QueryString):
+        """Run a read on one of our read-only connections (waits for a free one)"""
+        query_id = self.get_query_id()
+
+        if self.log_queries:
+            self.print_query(query_id=query_id, query=querystring.__str__())
+
+        query, args = querystring.compile_string(engine_type=self.engine_type)
+
+        pool = self.pool
+        connection = await pool.get()
+        try:
+            async with connection.execute(query, args) as cursor:
+                response = await cursor.fetchall()
+        finally:
+            pool.put_nowait(connection)
+
+        if self.log_responses:
+            self.print_response(query_id=query_id, response=response)
+
+        return response
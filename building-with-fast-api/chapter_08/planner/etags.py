@@ -0,0 +1,56 @@
+# ------------------------------------------------------------------------------
+# ETags and conditional `GET`s
+# ==============================================================================
+# > Our slow 4G users (see `PROBLEM.md`) shouldn't download the same list twice!
+# > @ https://developer.mozilla.org/en-US/docs/Web/HTTP/Reference/Headers/ETag
+#
+# The server sends an `ETag` (a version label for the response). Next time, the
+# client sends it back as `If-None-Match`, and if nothing has changed we reply
+# with an empty `304 Not Modified`. No body, no serialisation, tiny response.
+#
+# 1. A single event gets a STRONG ETag: a hash of it's field values
+# 2. A page of events gets a WEAK ETag (`W/"..."`): the events generation (see
+#    `planner/coherence.py`) plus a hash of the page's query and event `id`s
+#
+# Neither needs the JSON body to be built first. Events can't be edited (there's
+# no `PUT` route), so the `id`s are enough to tell one page from another.
+#
+#
+# Weak comparison
+# ---------------
+# > `If-None-Match` always uses weak comparison (`W/"abc"` matches `"abc"`)
+#
+#     @ https://www.rfc-editor.org/rfc/rfc9110#name-if-none-match
+
+from fastapi import Response
+from hashlib import blake2b
+
+
+def strong_etag(*values) -> str:
+    return f'"{_digest(values)}"'
+
+
+def weak_etag(generation: int, *values) -> str:
+    return f'W/"{generation}-{_digest(values)}"'
+
+
+def matches(etag: str | None, if_none_match: str | None) -> bool:
+    """Does the client already have this version? (weak comparison)"""
+    if not etag or not if_none_match:
+        return False
+    elif if_none_match.strip() == "*":
+        return True
+
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque
+        for tag in if_none_match.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def _digest(values: tuple) -> str:
+    return blake2b(repr(values).encode(), digest_size=12).hexdigest()
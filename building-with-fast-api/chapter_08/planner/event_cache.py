@@ -0,0 +1,146 @@
+# ------------------------------------------------------------------------------
+# Event read cache
+# ==============================================================================
+# > Our workload is read-heavy with rare writes, so most `GET`s shouldn't need
+# > to touch SQLite at all. See `planner/cache.py` for the cache itself.
+#
+# We cache two kinds of thing:
+#
+# 1. A single event, keyed by `("event", id, fields)`
+# 2. A page of events, keyed by `("page", sort, cursor, limit, tags, match, fields)`
+# 3. Tag counts, keyed by `("tags", limit)` (dropped on every write)
+#
+# Entries expire after `EVENT_CACHE_TTL` seconds, but we don't rely on that for
+# our own writes: `create_event` and `delete_event` invalidate precisely.
+#
+#
+# Precise invalidation
+# --------------------
+# > Keyset pages are anchored to their cursor, so a write can't "shift" pages.
+#
+# Each cached page remembers where it starts (`after`, the cursor row) and where
+# it ends (`last`, it's last row), as sort keys. A written row only changes the
+# pages it falls inside of:
+#
+# 1. An insert lands in a page if it sorts after the cursor, and either before
+#    the page's last row, or the page isn't full (it's the last page).
+# 2. A delete only changes the page that contains the row.
+#
+# A page filtered by tags (see `planner/tags.py`) is only changed if the row has
+# those tags. Every other page (and every other event) stays in the cache.
+#
+#
+# Race conditions
+# ---------------
+# > A read can start before a write and finish after it (with old data).
+#
+# We count every invalidation with `version`. A read grabs the version before it
+# queries, and `store()` won't cache it's result if a write happened meanwhile.
+#
+#
+# Other workers
+# -------------
+# > Always use `lookup()` (not `event_cache.get()`) so we notice their writes.
+#
+# `lookup()` asks `planner/coherence.py` if another process has written to our
+# events since we last looked. If so, we can't know which pages changed, so we
+# drop the lot with `invalidate_all()`.
+
+from decouple import config
+from planner import coherence, metrics
+from planner.cache import TTLCache
+from planner.tags import has_tags
+
+
+CACHE_TTL = config("EVENT_CACHE_TTL", default=30, cast=float) # seconds
+CACHE_SIZE = config("EVENT_CACHE_SIZE", default=1024, cast=int) # entries
+
+event_cache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+metrics.watch_cache("events", event_cache)
+version = 0
+
+
+def event_key(id, fields: tuple = ()) -> tuple:
+    return ("event", str(id), fields)
+
+
+def page_key(sort: str, cursor: str | None, limit: int, tags: tuple = (), match: str = "all", fields: tuple = ()) -> tuple:
+    return ("page", sort, cursor, limit, tags, match, fields)
+
+
+def tags_key(limit: int) -> tuple:
+    return ("tags", limit)
+
+
+def sort_key(sort: str, value, id) -> tuple:
+    """Python equivalent of SQLite's `ORDER BY column, id` (`NULL`s first)
+
+    > `Event.id` is an integer, so NEVER compare it as a string ("10" < "9")!
+    """
+    if sort == "id":
+        return (id,)
+
+    return (value is not None, "" if value is None else str(value), id)
+
+
+def row_key(sort: str, row: dict) -> tuple:
+    return sort_key(sort, row["id"] if sort == "id" else row[sort], row["id"])
+
+
+def lookup(key: tuple) -> dict | None:
+    """Get a cached entry (after checking other workers haven't written)"""
+    if coherence.refresh():
+        invalidate_all()
+
+    return event_cache.get(key)
+
+
+def store(key: tuple, value, seen_version: int, **extra) -> dict:
+    """Cache a result (unless there's been a write since we started reading).
+
+    > Pages also need their `sort`, `after`, `last` and `full` bounds (and their
+    > `tags` and `match` filter).
+    > Any `extra` (such as an `etag`) is kept alongside the `value`.
+
+    Returns the entry, whether it was cached or not.
+    """
+    entry = {"value": value, **extra}
+
+    if seen_version == version:
+        event_cache.set(key, entry)
+
+    return entry
+
+
+def invalidate(row: dict, deleted: bool = False):
+    """Drop the cached event (all it's `?fields=`), and any cached page this row lands in."""
+    global version
+    version += 1
+
+    event = event_key(row["public_id"])[:2]
+    event_cache.pop_where(
+        lambda key, entry: key[0] == "tags"
+        or key[:2] == event
+        or (key[0] == "page" and _in_page(row, entry, deleted))
+    )
+
+
+def _in_page(row: dict, entry: dict, deleted: bool) -> bool:
+    key = row_key(entry["sort"], row)
+
+    if not has_tags(row["tags"], entry["tags"], entry["match"]):
+        return False
+    elif entry["after"] is not None and key <= entry["after"]:
+        return False
+    elif deleted:
+        return entry["last"] is not None and key <= entry["last"]
+    else:
+        return not entry["full"] or key < entry["last"]
+
+
+def invalidate_all():
+    """Drop everything (we don't know what another worker changed)"""
+    global version
+    version += 1
+
+    event_cache.clear()
@@ -0,0 +1,126 @@
+# ------------------------------------------------------------------------------
+# Nearby events (an R*Tree spatial index)
+# ==============================================================================
+# > "Current location within radius of event" is how our users pick an event
+# > (see `PROBLEM.md`). Within a 10 minute walk is roughly 800 metres.
+# > @ https://www.sqlite.org/rtree.html
+#
+# `Event.latitude` and `Event.longitude` are optional (not every event has a map
+# pin). `event_geo` is an R*Tree index of every event that HAS coordinates:
+#
+# 1. Triggers keep it in sync with EVERY write (our writer, or raw admin SQL)
+# 2. It's filled from existing events the first time it's created
+# 3. Each event is a "box" with zero size (`min_lat = max_lat`, etc)
+#
+# An R*Tree answers "what's inside this box?" without scanning the table. It
+# can't sort by distance, so we do that ourselves (it's only a few rows).
+#
+#
+# Nearest first
+# -------------
+# > We only want the nearest few events (tiny responses for slow 4G!)
+#
+# A big radius in a busy city could have thousands of events inside it. So we
+# start with a small box, and double it until we've got enough events WITHIN
+# the circle (or we reach the radius). Anything outside the circle is further
+# away than everything inside it, so those really are the nearest.
+#
+# 1. Box: the square around the circle (degrees of longitude shrink towards
+#    the poles, so it's wider in degrees the further north you go)
+# 2. Circle: the haversine (great circle) distance from the user
+#
+#     @ https://en.wikipedia.org/wiki/Haversine_formula
+#
+#
+# Older databases
+# ---------------
+# > SQLite can only `ALTER TABLE` to add a column, which is all we need.
+#
+# The `latitude` and `longitude` columns are added to an existing `planner.db`
+# on startup if they're missing (see `planner/schema.py`).
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Boxes don't wrap around the antimeridian (the Pacific) or the poles
+# 2. Should `/nearby` results be cached? (a rounded `lat`/`lon` as the key?)
+
+from math import asin, cos, radians, sin, sqrt
+from planner.tables import Event
+
+
+EARTH_RADIUS = 6_371_008.8 # metres (mean)
+METRES_PER_DEGREE = 111_320 # of latitude (roughly)
+FIRST_RADIUS = 250 # metres (the smallest box we search)
+
+COLUMNS = {
+    "latitude": 'ALTER TABLE "event" ADD COLUMN "latitude" REAL',
+    "longitude": 'ALTER TABLE "event" ADD COLUMN "longitude" REAL',
+}
+
+GEO = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS event_geo USING rtree('
+    'id, min_lat, max_lat, min_lon, max_lon)',
+
+    'CREATE TRIGGER IF NOT EXISTS event_geo_insert AFTER INSERT ON "event" '
+    'WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN '
+    'INSERT INTO event_geo VALUES (new.rowid, new.latitude, new.latitude, new.longitude, new.longitude); END',
+
+    'CREATE TRIGGER IF NOT EXISTS event_geo_delete AFTER DELETE ON "event" BEGIN '
+    'DELETE FROM event_geo WHERE id = old.rowid; END',
+
+    'CREATE TRIGGER IF NOT EXISTS event_geo_update AFTER UPDATE OF latitude, longitude ON "event" BEGIN '
+    'DELETE FROM event_geo WHERE id = old.rowid; '
+    'INSERT INTO event_geo SELECT new.rowid, new.latitude, new.latitude, new.longitude, new.longitude '
+    'WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL; END',
+]
+
+# Only run when `event_geo` is first created
+BACKFILL = [
+    'INSERT INTO event_geo SELECT rowid, latitude, latitude, longitude, longitude '
+    'FROM "event" WHERE latitude IS NOT NULL AND longitude IS NOT NULL',
+]
+
+SELECT = (
+    'SELECT "event".* FROM event_geo JOIN "event" ON "event".rowid = event_geo.id '
+    'WHERE event_geo.min_lat >= {} AND event_geo.max_lat <= {} '
+    'AND event_geo.min_lon >= {} AND event_geo.max_lon <= {}'
+)
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine distance in metres"""
+    dlat, dlon = radians(lat2 - lat1), radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(a)))
+
+
+def bounding_box(lat: float, lon: float, radius_m: float) -> tuple[float, float, float, float]:
+    """`(min_lat, max_lat, min_lon, max_lon)` of the square around the circle"""
+    dlat = radius_m / METRES_PER_DEGREE
+    dlon = radius_m / (METRES_PER_DEGREE * max(cos(radians(lat)), 0.01))
+    return (
+        max(lat - dlat, -90.0), min(lat + dlat, 90.0),
+        max(lon - dlon, -180.0), min(lon + dlon, 180.0),
+    )
+
+
+async def nearest(lat: float, lon: float, radius_m: float, limit: int) -> list[dict]:
+    """The nearest `limit` events within `radius_m`, with their `distance_m`."""
+    search_m = min(FIRST_RADIUS, radius_m)
+
+    while True:
+        rows = await Event.raw(SELECT, *bounding_box(lat, lon, search_m))
+        found = []
+
+        for row in rows:
+            row["distance_m"] = distance(lat, lon, row["latitude"], row["longitude"])
+            if row["distance_m"] <= search_m:
+                found.append(row)
+
+        if len(found) >= limit or search_m >= radius_m:
+            found.sort(key=lambda row: (row["distance_m"], row["id"]))
+            return found[:limit]
+
+        search_m = min(search_m * 2, radius_m)
@@ -0,0 +1,162 @@
+# ------------------------------------------------------------------------------
+# Time ordered IDs (UUID version 7, stored as 16 bytes)
+# ==============================================================================
+# > Random `UUID`s (version 4) scatter inserts all over the primary key index.
+# > @ https://www.rfc-editor.org/rfc/rfc9562#name-uuid-version-7
+#
+# Piccolo's `UUID()` column stores a random UUID as a 36 character string. That's
+# slow for two reasons:
+#
+# 1. Size: 36 bytes (plus overhead) rather than 16, in the table AND the index
+# 2. Random order: every insert lands on a random index page, so SQLite has to
+#    read (and split) pages all over the file, and hardly any stay cached
+#
+# A version 7 UUID starts with the time (in milliseconds), so new IDs are always
+# bigger than old ones. Every insert appends to the right-hand edge of the index,
+# which is the same page (or a new one) every time. They're still a `UUID`, so
+# they look the same in URLs (and work with Pydantic, `str()`, etc).
+#
+#     | 1m inserts (2k per commit)  | Time  | File size |
+#     | --------------------------- | ----- | --------- |
+#     | `UUID()` (random, string)   | 32.7s | 130MB     |
+#     | `UUID7()` (ordered, bytes)  | 8.8s  | 90MB      |
+#
+#
+# Storage
+# -------
+# > `UUID7()` is a `Bytea` (BLOB) column with it's own SQLite type name.
+#
+# SQLite lets us register a "converter" for a declared column type, so the 16
+# bytes come back out as a `uuid.UUID` (just like Piccolo's `UUID()` column).
+# Going in, we pass the `.bytes` ourselves: use `parse_id()` for anything that
+# comes from a URL or a cursor.
+#
+#     @ https://docs.python.org/3/library/sqlite3.html#sqlite3-converters
+#
+# Older databases (with string IDs) are converted on startup, see
+# `planner/migrate_ids.py`.
+#
+#
+# Public IDs
+# ----------
+# > An integer `Event.id` for us, a short `Event.public_id` for URLs.
+#
+# `Event.id` is a `Serial()` (SQLite's `rowid`), so the table itself is stored in
+# `id` order, and every index or join on it is a small integer (1-8 bytes). It's
+# never shown to the client (it's easy to guess!)
+#
+# `Event.public_id` is our `UUID7()` (with a unique index), shown as 22 base62
+# characters (`0-9A-Za-z`) rather than 36: `/events/034hpcu9CI78aI2G5QDbPJ`.
+# `parse_id()` also accepts the long `UUID` form, so old URLs still work.
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Python 3.14 has `uuid.uuid7()` built in (we're on 3.13)
+# 2. IDs leak the time an event was created (is that a problem?)
+# 3. A shorter public ID? (64 bits is 11 characters, but collisions are likelier)
+
+from piccolo.columns import Bytea
+
+import os
+import sqlite3
+import time
+import uuid
+
+
+BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE62_LENGTH = 22 # Enough for 128 bits
+
+_PAIRS = [a + b for a in BASE62 for b in BASE62] # "00" to "zz"
+
+_last = 0
+
+
+def uuid7() -> uuid.UUID:
+    """A new time ordered UUID (always bigger than the last one we made)"""
+    global _last
+
+    milliseconds = time.time_ns() // 1_000_000
+    random = int.from_bytes(os.urandom(10))
+    value = (
+        (milliseconds & (2**48 - 1)) << 80
+        | 0x7 << 76 # Version
+        | (random >> 62 & 0xFFF) << 64 # 12 random bits
+        | 0b10 << 62 # Variant
+        | random & (2**62 - 1) # 62 random bits
+    )
+
+    if value <= _last: # Same millisecond (or the clock went backwards)
+        value = _last + 1
+
+    _last = value
+    return uuid.UUID(int=value)
+
+
+def new_id() -> bytes:
+    return uuid7().bytes
+
+
+def to_base62(value: uuid.UUID) -> str:
+    """A `UUID` as 22 base62 characters (they sort in the same order)
+
+    > Two characters at a time (half the `divmod`s), it's called for every row!
+    """
+    number, pairs = value.int, []
+
+    for _ in range(BASE62_LENGTH // 2):
+        number, remainder = divmod(number, 3844) # 62 ** 2
+        pairs.append(_PAIRS[remainder])
+
+    return "".join(reversed(pairs))
+
+
+def parse_id(value: str) -> uuid.UUID | None:
+    """A `UUID` from a URL (base62 or the long form), or `None` if it isn't one"""
+    value = str(value)
+
+    if len(value) != BASE62_LENGTH:
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            return None
+
+    number = 0
+    for character in value:
+        digit = BASE62.find(character)
+        if digit < 0:
+            return None
+        number = number * 62 + digit
+
+    return uuid.UUID(int=number) if number < 2**128 else None
+
+
+class UUID7(Bytea):
+    """A time ordered `UUID`, stored as 16 bytes.
+
+    > Selected values are `uuid.UUID`s, but queries need `.bytes`!
+    """
+
+    @property
+    def column_type(self):
+        if self._meta.engine_type == "sqlite":
+            return "UUIDBLOB" # Contains "BLOB", so SQLite gives it BLOB affinity
+        return super().column_type
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("default", new_id)
+        super().__init__(**kwargs)
+
+    @property
+    def ddl(self) -> str:
+        """No `DEFAULT` (Piccolo would call `new_id()` once, for EVERY row!)"""
+        return super().ddl.split(" DEFAULT ")[0]
+
+
+def _convert_out(value: bytes) -> uuid.UUID:
+    """16 bytes, or a string `UUID` (from raw SQL) so reads don't break"""
+    return uuid.UUID(bytes=value) if len(value) == 16 else uuid.UUID(value.decode())
+
+
+sqlite3.register_converter("UUIDBLOB", _convert_out)
@@ -0,0 +1,267 @@
+# ------------------------------------------------------------------------------
+# Metrics (Prometheus)
+# ==============================================================================
+# > "Add the number of `-c`oncurrent connections ... add a timer to your response
+# > headers" (see `PERFORMANCE.md`). Logs are for reading; metrics are for graphs.
+#
+# `GET /metrics` returns everything below in Prometheus' text format, so you can
+# scrape it (Prometheus, Grafana Agent, or just `curl` before and after a run):
+#
+# 1. `planner_requests_total`: requests by method, route and status
+# 2. `planner_request_duration_seconds`: latency by route (p50, p95, p99, p999)
+# 3. `planner_requests_in_flight`: requests being handled right now (and it's peak)
+# 4. `planner_sqlite_lock_wait_seconds`: how long the writer waited for the lock
+# 5. `planner_sqlite_busy_total`: "database is locked" errors
+# 6. `planner_cache_*`: hits, misses and the hit ratio of each cache
+# 7. Any other gauges we've registered (the writer queue, hashes waiting, etc)
+#
+#     @ https://prometheus.io/docs/instrumenting/exposition_formats/
+#
+# Routes are labelled with their path TEMPLATE (`/events/{id}`), never the real
+# path, or every event would be a new time series. Anything that didn't match a
+# route (a `404`) is `<unmatched>`.
+#
+#
+# Histograms (HDR style)
+# ----------------------
+# > Averages hide the slow requests, so we keep every latency (roughly!)
+#
+# Each latency (in microseconds) goes in a bucket. Under 32µs every value has
+# it's own bucket; above that, each power of two is split into 16 buckets. So a
+# bucket is never more than ~6% wide, however slow the request: 1ms and 10s are
+# both measured to within 6%. That's the trick HdrHistogram uses.
+#
+#     @ https://hdrhistogram.github.io/HdrHistogram/
+#
+# Recording is one integer added to a list (no sorting, no memory growth). The
+# percentiles are only worked out when `/metrics` is scraped, and are reported as
+# the top of their bucket (a little pessimistic, never optimistic).
+#
+#
+# Cost
+# ----
+# > Cheap enough to leave on under a `-c 125` bombardier run.
+#
+# Everything is recorded on the event loop thread, so there are no locks (the same
+# as `planner/cache.py`). A request costs a few dict lookups and integer additions.
+# Our existing middleware records it (we don't add another `BaseHTTPMiddleware`,
+# see `README.md#-performance`).
+#
+#
+# SQLite locks
+# ------------
+# > SQLite's busy handler retries for us (up to `busy_timeout`), so we can't count
+# > each retry. We can count how long it took, and when it gave up.
+#
+# 1. Lock wait: from the start of a writer batch to holding the `IMMEDIATE` lock
+#    (see `planner/writer.py`). It's near zero unless something else is writing
+# 2. Busy: a query (or `BEGIN`/`COMMIT`) that still failed with `SQLITE_BUSY`
+#    after all those retries (see `planner/engine.py`)
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Each `uvicorn --workers` has it's own metrics (scrape them all, or use the
+#    `prometheus_client` multiprocess mode)
+# 2. Should `/metrics` be admin only? (it's on a private network, for now)
+
+from typing import Callable
+
+import math
+import sqlite3
+
+
+QUANTILES = (0.5, 0.95, 0.99, 0.999)
+
+SUB_BUCKET_BITS = 5 # 32 linear buckets, then 16 per power of two
+BUCKETS = 512 # Up to ~9 hours (in microseconds)
+
+UNMATCHED = "<unmatched>"
+
+_requests: dict[tuple[str, str, int], int] = {} # (method, route, status): count
+_latency: dict[tuple[str, str], dict] = {} # (method, route): histogram
+_in_flight = {"now": 0, "max": 0}
+_sqlite = {"busy": 0}
+
+_caches: dict[str, object] = {} # name: `TTLCache`
+_gauges: dict[str, tuple[str, Callable[[], float]]] = {} # name: (help, value)
+
+
+# ------------------------------------------------------------------------------
+# Histograms
+# ==============================================================================
+
+def histogram() -> dict:
+    return {"count": 0, "sum": 0.0, "buckets": [0] * BUCKETS}
+
+
+def observe(histogram: dict, seconds: float):
+    histogram["count"] += 1
+    histogram["sum"] += seconds
+    histogram["buckets"][min(_bucket(int(seconds * 1_000_000)), BUCKETS - 1)] += 1
+
+
+def quantile(histogram: dict, q: float) -> float:
+    """The `q` quantile in seconds (the top of it's bucket), or `0.0` if empty"""
+    rank = math.ceil(q * histogram["count"])
+    seen = 0
+
+    for index, count in enumerate(histogram["buckets"]):
+        seen += count
+        if count and seen >= rank:
+            return _highest(index) / 1_000_000
+
+    return 0.0
+
+
+def _bucket(microseconds: int) -> int:
+    """Exact below 32µs, then the top 5 bits (so ~6% wide at most)"""
+    shift = max(microseconds.bit_length() - SUB_BUCKET_BITS, 0)
+    return (shift << (SUB_BUCKET_BITS - 1)) + (microseconds >> shift)
+
+
+def _highest(index: int) -> int:
+    """The largest value (in microseconds) that lands in this bucket"""
+    half = 1 << (SUB_BUCKET_BITS - 1)
+    shift = max(index // half - 1, 0)
+    top = index - (shift << (SUB_BUCKET_BITS - 1))
+    return ((top + 1) << shift) - 1
+
+
+_lock_wait = histogram()
+
+
+# ------------------------------------------------------------------------------
+# Recording
+# ==============================================================================
+
+def request_started():
+    _in_flight["now"] += 1
+    _in_flight["max"] = max(_in_flight["max"], _in_flight["now"])
+
+
+def request_finished(method: str, route: str | None, status: int, seconds: float):
+    """Call once per request, after `request_started()` (even if it failed)"""
+    _in_flight["now"] -= 1
+    route = route or UNMATCHED
+
+    key = (method, route, status)
+    _requests[key] = _requests.get(key, 0) + 1
+
+    latency = _latency.get((method, route))
+    if latency is None:
+        latency = _latency[(method, route)] = histogram()
+    observe(latency, seconds)
+
+
+def route_template(path: str, route) -> str | None:
+    """The matched route's full template (`/events/{id}`), or `None` (a `404`).
+
+    > Routes from `include_router()` only know their own path (`/{id}`), not the
+    > prefix, so we take the prefix from the real path.
+    """
+    if route is None:
+        return None
+
+    template = route.path
+    return path.rsplit("/", template.count("/"))[0] + template
+
+
+def lock_waited(seconds: float):
+    observe(_lock_wait, seconds)
+
+
+def sqlite_error(error: Exception):
+    """Count it if it's `SQLITE_BUSY` ("database is locked")"""
+    if isinstance(error, sqlite3.OperationalError) and (
+        "locked" in str(error) or "busy" in str(error)
+    ):
+        _sqlite["busy"] += 1
+
+
+def watch_cache(name: str, cache):
+    """Report a `TTLCache`'s `stats()` as `planner_cache_*{cache="name"}`"""
+    _caches[name] = cache
+
+
+def gauge(name: str, help: str, value: Callable[[], float]):
+    """Report `value()` (called on every scrape) as `planner_{name}`"""
+    _gauges[name] = (help, value)
+
+
+# ------------------------------------------------------------------------------
+# Prometheus text format
+# ==============================================================================
+
+def render() -> str:
+    lines = []
+
+    _metric(lines, "requests_total", "counter", "Requests by route and status", [
+        ({"method": method, "route": route, "status": status}, count)
+        for (method, route, status), count in sorted(_requests.items())
+    ])
+
+    lines += _summary("request_duration_seconds", "Request latency by route", [
+        ({"method": method, "route": route}, latency)
+        for (method, route), latency in sorted(_latency.items())
+    ])
+
+    _metric(lines, "requests_in_flight", "gauge", "Requests being handled right now",
+            [({}, _in_flight["now"])])
+    _metric(lines, "requests_in_flight_max", "gauge", "Most requests handled at once",
+            [({}, _in_flight["max"])])
+
+    lines += _summary("sqlite_lock_wait_seconds", "Writer wait for the IMMEDIATE lock",
+                      [({}, _lock_wait)])
+    _metric(lines, "sqlite_busy_total", "counter", "Queries that failed with SQLITE_BUSY",
+            [({}, _sqlite["busy"])])
+
+    stats = {name: cache.stats() for name, cache in sorted(_caches.items())}
+    for name, kind, help in (
+        ("hits", "counter", "Cache hits"),
+        ("misses", "counter", "Cache misses (including expired)"),
+        ("evictions", "counter", "Entries pushed out of a full cache"),
+        ("size", "gauge", "Entries in the cache"),
+        ("hit_ratio", "gauge", "Hits as a share of lookups"),
+    ):
+        suffix = "_total" if kind == "counter" else ""
+        _metric(lines, f"cache_{name}{suffix}", kind, help, [
+            ({"cache": cache}, values[name]) for cache, values in stats.items()
+        ])
+
+    for name, (help, value) in sorted(_gauges.items()):
+        _metric(lines, name, "gauge", help, [({}, value())])
+
+    return "\n".join(lines) + "\n"
+
+
+def _summary(name: str, help: str, series: list[tuple[dict, dict]]) -> list[str]:
+    lines = [f"# HELP planner_{name} {help}", f"# TYPE planner_{name} summary"]
+
+    for labels, histogram in series:
+        for q in QUANTILES:
+            lines.append(
+                f"planner_{name}{_labels({**labels, 'quantile': q})} {quantile(histogram, q)}"
+            )
+        lines.append(f"planner_{name}_sum{_labels(labels)} {histogram['sum']}")
+        lines.append(f"planner_{name}_count{_labels(labels)} {histogram['count']}")
+
+    return lines
+
+
+def _metric(lines: list, name: str, kind: str, help: str, series: list[tuple[dict, float]]):
+    lines += [f"# HELP planner_{name} {help}", f"# TYPE planner_{name} {kind}"]
+    lines += [f"planner_{name}{_labels(labels)} {value}" for labels, value in series]
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,111 @@
+# ------------------------------------------------------------------------------
+# Migrate event IDs (to a `Serial()` ID and a `UUID7()` public ID)
+# ==============================================================================
+# > SQLite can't change a column's type, so we rebuild the `event` table.
+# > @ https://www.sqlite.org/lang_altertable.html#otheralter
+#
+# Older databases have a `UUID` primary key (a string, or 16 bytes). Now that's
+# our `public_id`, and the primary key is an integer (see `planner/ids.py`).
+#
+# Runs automatically on startup (see `planner/schema.py`), and does nothing if
+# the `event` table is already converted. By default every event KEEPS it's
+# `UUID` (as it's `public_id`), so old URLs still work.
+#
+# 1. Rename `event` to `event_old` (it's triggers and indexes go with it)
+# 2. Create the new `event` table, and copy every row. The old `rowid` becomes
+#    the new `id`, so our full-text search and R*Tree indexes are still correct
+# 3. Drop `event_old`, and `event_tag` (which is rebuilt with integer IDs)
+#
+# It's all one `IMMEDIATE` transaction, so if it fails, nothing changes (and if
+# two workers start at once, the second one waits, then finds nothing to do).
+# Startup then recreates our indexes and triggers (see `planner/schema.py`).
+#
+#
+# Re-issuing IDs
+# --------------
+# > Old random `UUID`s stay random (they don't tell you when events were made)
+#
+# If you don't mind breaking old URLs, re-issue every `public_id` as a version 7
+# `UUID`, in insertion (`rowid`) order:
+#
+# ```
+# python -m planner.migrate_ids --reissue
+# ```
+#
+# ⚠️ Stop the app first, and take a backup (`sqlite3 planner.db ".backup ..."`).
+
+from planner.ids import new_id, parse_id
+from planner.tables import Event
+
+import argparse
+import asyncio
+import sqlite3
+
+
+def migrate_ids(path: str, reissue: bool = False) -> bool:
+    """Convert the `event` table to our new IDs (returns `False` if already done)"""
+    db = sqlite3.connect(path, isolation_level=None, timeout=30)
+    db.create_function("uuid_bytes", 1, _uuid_bytes, deterministic=True)
+    db.create_function("new_id", 0, new_id)
+
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        columns = {row[1]: row[2] for row in db.execute('PRAGMA table_info("event")')}
+        converted = columns.get("id") == "INTEGER" and "public_id" in columns
+
+        if not columns or (converted and not reissue):
+            db.execute("ROLLBACK")
+            return False
+
+        db.execute('ALTER TABLE "event" RENAME TO event_old')
+        for ddl in Event.create_table().ddl:
+            db.execute(ddl)
+
+        public_id = "new_id()" if reissue else (
+            "uuid_bytes(public_id)" if "public_id" in columns else "uuid_bytes(id)"
+        )
+        new_columns = {column._meta.db_column_name for column in Event._meta.columns}
+        copied = [name for name in columns if name not in ("id", "public_id") and name in new_columns]
+        names = ", ".join(f'"{name}"' for name in copied)
+
+        db.execute(
+            f'INSERT INTO "event" ("id", "public_id", {names}) '
+            f'SELECT rowid, {public_id}, {names} FROM event_old ORDER BY rowid'
+        )
+        db.execute("DROP TABLE event_old")
+        db.execute("DROP TABLE IF EXISTS event_tag")
+
+        db.execute("COMMIT")
+        return True
+    except BaseException:
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+    finally:
+        db.close()
+
+
+def _uuid_bytes(value) -> bytes:
+    """SQLite 3.40 has no `unhex()`, so convert string IDs in Python"""
+    if isinstance(value, bytes):
+        return value
+
+    parsed = parse_id(value)
+    if parsed is None:
+        raise ValueError(f"Event ID {value!r} is not a UUID")
+
+    return parsed.bytes
+
+
+if __name__ == "__main__":
+    from planner.schema import create_schema
+
+    parser = argparse.ArgumentParser(description="Migrate event IDs (see planner/migrate_ids.py)")
+    parser.add_argument("--reissue", action="store_true", help="give every event a NEW (version 7) public ID")
+    args = parser.parse_args()
+
+    if migrate_ids(Event._meta.db.path, reissue=args.reissue):
+        asyncio.run(create_schema()) # Indexes and triggers
+        print("✅ Events migrated")
+    else:
+        print("Nothing to do")
@@ -89,8 +89,10 @@
 # 2. ⚠️ Make sure data entry and return values are typed and predictable.
 #     - @ https://mypy.readthedocs.io/en/stable/typed_dict.html
 
-from pydantic import BaseModel, EmailStr, Field
+from planner.ids import to_base62
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import List
+from uuid import UUID
 
 
 class Event(BaseModel):
@@ -101,12 +103,79 @@ class Event(BaseModel):
     
     The `ID` and `Creator` fields are automatically generated by Piccolo. You
     don't have to supply it within the request body.
+
+    `latitude` and `longitude` are optional, but the event is only found by
+    `/events/nearby` if it has both.
     """
     title: str
     image: str
     description: str
     location: str
     tags: List[str] | None = None
+    latitude: float | None = Field(default=None, ge=-90, le=90)
+    longitude: float | None = Field(default=None, ge=-180, le=180)
+
+
+class EventOut(Event):
+    """ Event model for responses, with it's public ID (in base62).
+
+    > Our integer `Event.id` is NEVER shown (it's easy to guess).
+
+    Piccolo gives us `public_id` as a `UUID`, which we shorten to 22 characters
+    for URLs: `/events/{public_id}` (see `planner/ids.py`).
+    """
+    public_id: str
+
+    @field_validator("public_id", mode="before")
+    @classmethod
+    def shorten_id(cls, value):
+        return to_base62(value) if isinstance(value, UUID) else value
+
+
+class EventPage(BaseModel):
+    """ A single page of events (keyset pagination).
+
+    > `next` is an opaque cursor for the following page, or `None` if this is
+    > the last page. See `planner/cursors.py`.
+    """
+    events: List[EventOut]
+    next: str | None = None
+
+
+class SearchResult(EventOut):
+    """ An event found by `/events/search`, with the matching text highlighted.
+
+    > `snippet` wraps matching words in `<mark>` tags (the text ISN'T escaped).
+    """
+    snippet: str
+
+
+class SearchPage(BaseModel):
+    """ A single page of search results, best match first (see `EventPage`). """
+    events: List[SearchResult]
+    next: str | None = None
+
+
+class NearbyEvent(EventOut):
+    """ An event found by `/events/nearby`, with it's distance from the user. """
+    distance_m: float
+
+
+class BulkItem(BaseModel):
+    """ The result for one item of `POST /events/bulk` (by it's `index`).
+
+    > Either a `public_id` (it was created) or it's `errors` (it wasn't).
+    """
+    index: int
+    public_id: str | None = None
+    errors: List[dict] | None = None
+
+
+class BulkResult(BaseModel):
+    """ Results for `POST /events/bulk`, in the same order they were sent. """
+    created: int
+    failed: int
+    results: List[BulkItem]
 
 
 # ------------------------------------------------------------------------------
@@ -0,0 +1,12 @@
+# ------------------------------------------------------------------------------
+# Our TAG model (API layer)
+# ==============================================================================
+# > Tags aren't a table of their own, see `planner/tags.py` (the lookup table)
+
+from pydantic import BaseModel
+
+
+class TagCount(BaseModel):
+    """ A tag, and how many events have it. """
+    tag: str
+    count: int
@@ -18,11 +18,12 @@
 # ------------------------------------------------------------------------------
 # WISHLIST
 # ------------------------------------------------------------------------------
-# 1. Our `/user/me` profile endpoint may need `List (Event ID)`
-# 2. Hide the `password` fields in logs with `SecretStr`?
+# 1. Hide the `password` fields in logs with `SecretStr`?
 #     - @ https://docs.pydantic.dev/2.2/usage/types/secrets/
 
+from planner.models.events import EventOut
 from pydantic import BaseModel, EmailStr
+from typing import List
 
 
 class User(BaseModel):
@@ -38,3 +39,19 @@ class User(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
+
+
+class Profile(BaseModel):
+    """ The signed in user (NEVER their `password` or `ID`). """
+    username: str
+    email: EmailStr
+
+
+class ProfilePage(BaseModel):
+    """ `/users/me`: the user ONCE, then a page of their events.
+
+    > `next` is a cursor for their next page of events (see `EventPage`).
+    """
+    user: Profile
+    events: List[EventOut]
+    next: str | None = None
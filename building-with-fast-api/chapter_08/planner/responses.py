@@ -0,0 +1,121 @@
+# ------------------------------------------------------------------------------
+# Fast JSON responses (orjson)
+# ==============================================================================
+# > A `response_model=` validates EVERY row again, then `json.dumps()` it.
+#
+# Our read routes already have exactly the rows they want to send (straight out
+# of Piccolo). FastAPI would still:
+#
+# 1. Validate each row against the `response_model=` (`List[api.EventOut]`)
+# 2. Dump the models back into dicts
+# 3. Encode them with the standard library's `json` module
+#
+# For a page of 100 events that's more work than the query! Instead, we pick the
+# fields we're allowed to send (the `api.EventOut` fields, so `creator` and our
+# private `id` NEVER leak) and `orjson` turns them straight into bytes. When a
+# route returns a `Response` FastAPI sends it as it is.
+#
+#     @ https://github.com/ijl/orjson#performance
+#     @ https://fastapi.tiangolo.com/advanced/response-directly/
+#
+# Run `python -m testing.serialise.benchmark` (in `chapter_08`) to compare:
+#
+#     | 100 events (per page) | `response_model=` | orjson  |
+#     | --------------------- | ----------------- | ------- |
+#     | Serialise             | 1.38ms            | 0.58ms  |
+#
+# The bytes are what we cache, too (see `planner/event_cache.py`), so a cached
+# page is never serialised twice.
+#
+#
+# Response models
+# ---------------
+# > Keep the `response_model=` on the route: `/docs` still uses it!
+#
+# It's no longer checked, so any new field in `api.EventOut` must come from the
+# query (a missing field is a `KeyError`, not a silent `null`).
+#
+#
+# Sparse fieldsets
+# ----------------
+# > `?fields=title,location` (a slow 4G phone doesn't need every `description`)
+#
+#     @ https://jsonapi.org/format/#fetching-sparse-fieldsets
+#
+# `parse_fields()` checks the names against `api.EventOut` (anything else is a
+# `400`) and `columns()` turns them into the `select()` columns, so SQLite only
+# reads what we send. `public_id` is always included (you'll want to link to it!)
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. `ORJSONResponse` as the app's `default_response_class`? (but it still
+#    validates every `response_model=`)
+
+from fastapi import HTTPException, Response
+from planner.ids import to_base62
+from planner.models.events import EventOut
+
+from piccolo.columns import Column
+from planner.tables import Event
+from planner.timing import measure
+
+import orjson
+import uuid
+
+
+EVENT_FIELDS = tuple(EventOut.model_fields) # Our whitelist
+
+
+def parse_fields(fields: str | None) -> tuple[str, ...]:
+    """`?fields=title,location` as `EVENT_FIELDS` (in order), or a `400`"""
+    if fields is None:
+        return EVENT_FIELDS
+
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names.difference(EVENT_FIELDS)
+
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))} (try {', '.join(EVENT_FIELDS)})"
+        )
+
+    return tuple(name for name in EVENT_FIELDS if name in names or name == "public_id")
+
+
+def columns(fields: tuple[str, ...]) -> list[Column]:
+    return [Event._meta.get_column_by_name(name) for name in fields]
+
+
+def event(row: dict, fields: tuple[str, ...] = EVENT_FIELDS, extra: tuple[str, ...] = ()) -> dict:
+    """Only the fields we're allowed to send (with a base62 `public_id`)"""
+    fields = {name: row[name] for name in fields + extra}
+
+    if isinstance(fields["public_id"], uuid.UUID):
+        fields["public_id"] = to_base62(fields["public_id"])
+
+    return fields
+
+
+def events(rows: list[dict], fields: tuple[str, ...] = EVENT_FIELDS, extra: tuple[str, ...] = ()) -> list[dict]:
+    return [event(row, fields, extra) for row in rows]
+
+
+def dumps(content) -> bytes:
+    with measure("ser"): # `Server-Timing` (see `planner/timing.py`)
+        return orjson.dumps(content)
+
+
+def json_response(body: bytes, etag: str | None = None, encoding: str | None = None) -> Response:
+    """Send already serialised JSON (with it's `ETag`, if it has one).
+
+    > Pass the `encoding` if the body is already compressed (see `planner/compression.py`)
+    """
+    headers = {} if etag is None else {"ETag": etag}
+
+    if encoding is not None:
+        headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+
+    return Response(content=body, media_type="application/json", headers=headers)
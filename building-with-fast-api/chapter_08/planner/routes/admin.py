@@ -0,0 +1,45 @@
+# ------------------------------------------------------------------------------
+# Our ADMIN routes
+# ==============================================================================
+# > Every route here needs a signed in `BaseUser.admin` (see `authenticate_admin()`)
+#
+# Make someone an admin with raw SQL (there's no route for it, on purpose):
+#
+# ```
+# UPDATE piccolo_user SET admin = 1 WHERE username = 'rob';
+# ```
+
+from auth.authenticate import authenticate_admin
+from fastapi import APIRouter, Depends, Query
+from planner import slow_queries
+
+from typing import Annotated, Literal
+
+
+admin_router = APIRouter(
+    tags=["Admin"], # used for `/redoc` (menu groupings)
+    dependencies=[Depends(authenticate_admin)]
+)
+
+
+# ------------------------------------------------------------------------------
+# Slow queries
+# ==============================================================================
+
+@admin_router.get("/slow-queries")
+async def retrieve_slow_queries(
+        limit: Annotated[int, Query(ge=1, le=500)] = 20,
+        sort: Literal["total", "max", "count"] = "total"
+    ) -> dict:
+    """The slowest query fingerprints, with their query plan (see `planner/slow_queries.py`)
+
+    > Look for `scans`: they read the whole table (or index) instead of seeking.
+    """
+    return slow_queries.top(limit, sort)
+
+
+@admin_router.delete("/slow-queries")
+async def delete_slow_queries() -> dict:
+    """Start again (before a load test, say)"""
+    slow_queries.clear()
+    return { "message": "Slow queries cleared" }
@@ -126,11 +126,21 @@
 # 2. What are path, query, and request parameters?
 # 3. What are named keyword arguments and `**kwargs`?
 
-from auth.authenticate import authenticate
-from fastapi import APIRouter, Depends, HTTPException, Query
+from auth.authenticate import authenticate, authenticate_admin
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 import planner.tables as data # data.Event
 import planner.models.events as api # api.Event
+from planner import bulk, coherence, compression, etags, export, responses
+from planner.cursors import decode_cursor, encode_cursor, keyset
+from planner.engine import use_reader
+from planner.geo import nearest
+from planner.ids import parse_id
+import planner.event_cache as cache
+from planner.search import match_query, search_page
+from planner.tags import MAX_TAGS, Match, normalise, tag_filter
+from planner.writer import write
 
 from typing import Annotated, List
 
@@ -143,18 +153,43 @@ event_router = APIRouter(
 # ------------------------------------------------------------------------------
 # Read routes
 # ==============================================================================
+# > Read routes use our pool of read-only connections (see `planner/engine.py`)
 
-@event_router.get("/", response_model=List[api.Event])
+PAGE_SIZE = 20 # Default `?limit=`
+PAGE_LIMIT = 100 # Maximum `?limit=` (keeps response size bounded)
+
+SORTS = {
+    "title": data.Event.title,
+    "location": data.Event.location,
+}
+
+
+@event_router.get("/", response_model=api.EventPage, dependencies=[Depends(use_reader)])
 async def retrieve_all_events(
-        q: Annotated[str | None, Query(min_length=4, max_length=8)] = None
-    ) -> List[api.Event]:
-    """Return a queryable list of events!
+        q: Annotated[str | None, Query(min_length=4, max_length=8)] = None,
+        cursor: Annotated[str | None, Query(max_length=512)] = None,
+        limit: Annotated[int, Query(ge=1, le=PAGE_LIMIT)] = PAGE_SIZE,
+        tag: Annotated[list[str] | None, Query()] = None,
+        match: Match = "all",
+        fields: Annotated[str | None, Query(max_length=200)] = None,
+        if_none_match: Annotated[str | None, Header()] = None,
+        accept_encoding: Annotated[str | None, Header(include_in_schema=False)] = None
+    ) -> api.EventPage:
+    """Return a queryable (and paginated) list of events!
+
+    > Default order is by primary key `Event.id` (an integer), which is the
+    > order events were created. Every sort uses `Event.id` as a tie-breaker.
 
-    > Default order is by primary key (which is an indexed number), meaning
-    > `Event.id` appears in insertion order (not by `UUID` order).
-    
     Out API layer models are custom and we can use them as response types.
 
+    Pagination
+    ----------
+    > We use keyset pagination, NEVER `OFFSET` (see `planner/cursors.py`)
+
+    Our events table is too big to return in one go. Each page returns a `next`
+    cursor which the client sends back as `?cursor=` (with the same `?q=`) to get
+    the following page. `next` is `None` on the last page.
+
     Annotated
     ---------
     > @ https://fastapi.tiangolo.com/tutorial/query-params-str-validations/
@@ -171,42 +206,241 @@ async def retrieve_all_events(
     1. By title
     2. By location
 
+    Sparse fieldsets
+    ----------------
+    > `?fields=title,location` only reads (and sends) those fields, plus the
+    > `public_id`. Leave out `description` on slow connections!
+
+    Filter by tags
+    --------------
+    > `?tag=music&tag=adults` for events with both tags, add `&match=any` for
+    > events with either. Works with any sort order (see `planner/tags.py`).
+
     Errors
     ------
     > Be careful of your endpoint url structure
 
     1. ✅ `event/?q=title` (feels wrong but is right)
     2. ❌ `event?q=title` (feels right but is wrong)
+    3. ❌ `event/?q=title&cursor=...` with a cursor from another `?q=` (400)
+    4. ❌ More than `MAX_TAGS` tags, or a tag longer than 50 characters (400)
+    5. ❌ `?fields=` that aren't `api.EventOut` fields (400)
+
+    Caching
+    -------
+    > Pages are cached until a write lands in them (see `planner/event_cache.py`)
+
+    Each page has a weak `ETag`. Send it back as `If-None-Match` and you'll get
+    an empty `304` if the page hasn't changed (see `planner/etags.py`).
     """
-    query = data.Event.select()
+    sort = q if q in SORTS else "id"
+    tags = normalise(tag)
+    fields = responses.parse_fields(fields)
+
+    if len(tags) > MAX_TAGS or any(len(t) > 50 for t in tags):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Filter by at most {MAX_TAGS} tags (of up to 50 characters)"
+        )
+
+    key = cache.page_key(sort, cursor, limit, tags, match, fields)
+    entry = cache.lookup(key)
+
+    if entry is not None:
+        return _conditional(entry, if_none_match, accept_encoding)
+
+    seen_version = cache.version
+    generation = coherence.generation()
+    column = SORTS.get(sort, data.Event.id)
+    after = None
+    selected = [data.Event.id, *responses.columns(fields)]
+
+    if column not in selected: # We need it for the cursor
+        selected.append(column)
+
+    query = (
+        data.Event.select(*selected)
+        .order_by(column, data.Event.id)
+        .limit(limit + 1) # One extra row tells us if there's a next page
+    )
 
-    if q == "title":
-        return await query.order_by(data.Event.title)
-    elif q == "location":
-        return await query.order_by(data.Event.location)
+    if cursor:
+        value, id = decode_cursor(sort, cursor)
+        query = query.where(keyset(column, data.Event.id, value, id))
+        after = cache.sort_key(sort, value, id)
+
+    if tags:
+        query = query.where(tag_filter(tags, match))
+
+    events = await query
+    page, extra = events[:limit], events[limit:]
+
+    if extra:
+        last = page[-1]
+        next_cursor = encode_cursor(sort, last[column._meta.name], last["id"])
     else:
-        return await query
+        next_cursor = None
+
+    result = responses.dumps({ "events": responses.events(page, fields), "next": next_cursor })
+    etag = None if generation is None else etags.weak_etag(
+        generation, key, tuple(str(event["id"]) for event in page)
+    )
+    entry = cache.store(
+        key, result, seen_version,
+        etag=etag,
+        tags=tags,
+        match=match,
+        sort=sort,
+        after=after,
+        last=cache.row_key(sort, page[-1]) if page else None,
+        full=bool(extra)
+    )
+
+    return _conditional(entry, if_none_match, accept_encoding)
+
+
+@event_router.get("/search", response_model=api.SearchPage, dependencies=[Depends(use_reader)])
+async def search_events(
+        q: Annotated[str, Query(min_length=2, max_length=100)],
+        cursor: Annotated[str | None, Query(max_length=512)] = None,
+        limit: Annotated[int, Query(ge=1, le=PAGE_LIMIT)] = PAGE_SIZE
+    ) -> api.SearchPage:
+    """Full-text search over event titles, descriptions and locations.
+
+    > ⚠️ Declared BEFORE `/{id}`, otherwise "search" would be treated as an `id`!
 
+    Results are ranked by BM25 (best match first) and every word must match (the
+    last as a prefix): `?q=electronic danc` finds "Electronic Dance Night". Each
+    result has a highlighted `snippet`. See `planner/search.py` for the FTS5 index.
+
+    ⚠️ Two limits (see "Speed" in `planner/search.py`):
+
+    1. Ranking is approximate: matches are ranked `SEARCH_CANDIDATES` at a time,
+       newest first, so a great older match comes after every newer one (keep
+       paging, nothing is left out)
+    2. Common words take 14-21ms on a million events (we aim for under 10ms)
+
+    Pagination
+    ----------
+    > Same as `/events/`: send `next` back as `?cursor=` (with the same `?q=`)
+    """
+    match = match_query(q)
+    page, next_cursor = await search_page(match, limit, cursor)
+
+    return responses.json_response(responses.dumps({
+        "events": responses.events(page, extra=("snippet",)),
+        "next": next_cursor
+    }))
+
+
+@event_router.get("/nearby", response_model=List[api.NearbyEvent], dependencies=[Depends(use_reader)])
+async def retrieve_nearby_events(
+        lat: Annotated[float, Query(ge=-90, le=90)],
+        lon: Annotated[float, Query(ge=-180, le=180)],
+        radius_m: Annotated[float, Query(gt=0, le=50_000)] = 800,
+        limit: Annotated[int, Query(ge=1, le=50)] = 3
+    ) -> List[api.NearbyEvent]:
+    """The nearest events to the user (nearest first), within `radius_m` metres.
+
+    > ⚠️ Declared BEFORE `/{id}`, otherwise "nearby" would be treated as an `id`!
+
+    The default radius is about a 10 minute walk, and the default `limit` is tiny
+    on purpose (slow 4G). Each event has it's `distance_m` from the user. Events
+    without coordinates are never included. See `planner/geo.py`.
+    """
+    events = await nearest(lat, lon, radius_m, limit)
+    return responses.json_response(responses.dumps(responses.events(events, extra=("distance_m",))))
 
-@event_router.get("/{id}")
-async def retrieve_event(id: str) -> api.Event:
-    """Retrieve a single event by UUID
+
+@event_router.get("/export", response_class=StreamingResponse, dependencies=[Depends(use_reader)])
+async def export_events(format: export.Format = "ndjson") -> StreamingResponse:
+    """Download every event as NDJSON (one per line) or CSV, streamed in chunks.
+
+    > ⚠️ Declared BEFORE `/{id}`, otherwise "export" would be treated as an `id`!
+
+    Rows are read (and sent) `EXPORT_CHUNK_SIZE` at a time, so memory stays the
+    same however many events there are. See `planner/export.py`.
+    """
+    return StreamingResponse(
+        export.stream(format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="events.{format}"'}
+    )
+
+
+@event_router.get("/{id}", dependencies=[Depends(use_reader)])
+async def retrieve_event(
+        id: str,
+        fields: Annotated[str | None, Query(max_length=200)] = None,
+        if_none_match: Annotated[str | None, Header()] = None,
+        accept_encoding: Annotated[str | None, Header(include_in_schema=False)] = None
+    ) -> api.EventOut:
+    """Retrieve a single event by it's public ID
     
     > ✅ Piccolo is a lot more terse and pleasant than Peewee in some ways.
+    > ⚠️ `Event.public_id` is stored as bytes, so query with `parse_id(id).bytes`
     
     Any exceptions are dealt with by `HTTPException`. There are other ways we
     could raise errors, such as `RecordNotFound`. I dislike  `try/except/finally`
     blocks, so avoiding them like the plague!
+
+    Events are cached until they're deleted (see `planner/event_cache.py`),
+    and have a strong `ETag` for conditional requests (see `planner/etags.py`).
+    Use `?fields=` to pick the fields you need (like `/events/`).
     """
-    event = await data.Event.select().where(data.Event.id == id).first()
+    event_id = parse_id(id)
+    fields = responses.parse_fields(fields)
+
+    if event_id is None: # Not a public ID, so it can't exist
+        raise HTTPException(
+            status_code=404,
+            detail=f"Event with ID: {id} does not exist"
+        )
+
+    key = cache.event_key(event_id, fields)
+    entry = cache.lookup(key)
+
+    if entry is not None:
+        return _conditional(entry, if_none_match, accept_encoding)
+
+    seen_version = cache.version
+    event = await (
+        data.Event.select(*responses.columns(fields))
+        .where(data.Event.public_id == event_id.bytes)
+        .first()
+    )
 
     if not event:
         raise HTTPException(
             status_code=404,
             detail=f"Event with ID: {id} does not exist"
         )
+
+    etag = etags.strong_etag(fields, *(event[field] for field in fields))
+    entry = cache.store(key, responses.dumps(responses.event(event, fields)), seen_version, etag=etag)
     
-    return event
+    return _conditional(entry, if_none_match, accept_encoding)
+
+
+@event_router.get("/cache/stats")
+async def retrieve_cache_stats(user: int = Depends(authenticate_admin)) -> dict:
+    """Hit, miss and eviction counters for our event read cache (admins only)."""
+    return cache.event_cache.stats()
+
+
+def _conditional(entry: dict, if_none_match: str | None, accept_encoding: str | None) -> Response:
+    """Return `304 Not Modified` if the client's `ETag` matches, else the value.
+
+    > Cached values are already JSON bytes (see `planner/responses.py`), and
+    > keep their compressed bytes too (see `planner/compression.py`)
+    """
+    encoding = compression.choose(entry["value"], accept_encoding)
+    etag = compression.etag(entry["etag"], encoding)
+
+    if etag is not None and etags.matches(etag, if_none_match):
+        return etags.not_modified(etag)
+
+    return responses.json_response(compression.cached(entry, encoding), etag, encoding)
 
 
 # ------------------------------------------------------------------------------
@@ -216,18 +450,21 @@ async def retrieve_event(id: str) -> api.Event:
 @event_router.post("/")
 async def create_event(
     body: api.Event,
-    user: int = Depends(authenticate)) -> api.Event:
+    user: int = Depends(authenticate)) -> api.EventOut:
     """Create a new event
 
-    > ✅ `Event.id` is auto-generated by Piccolo.
+    > ✅ `Event.id` and `Event.public_id` are auto-generated by Piccolo.
     > ✅ `authenticate() -> username | error` (no need to check again)
 
     1. Our user `id` is required to create the event.
-    2. Our event has a `UUID` which can be shortened for prettier URLs.
+    2. Our event has a `public_id` (shortened to base62 for prettier URLs).
 
     We've avoided having an `IMMEDIATE` transaction here, as our authenticate
     function now returns the user `ID` which we can use for `creator=`.
 
+    Writes go through our single writer (see `planner/writer.py`), which groups
+    concurrent inserts into one transaction. We still get our own row back.
+
     Security
     --------
     - ⚠️ Never expose sensitive information like `ID` in responses (security)
@@ -246,16 +483,46 @@ async def create_event(
     """
     event = body.model_dump(exclude_none=True) # Event -> dict
 
-    query = await (
+    query = await write(
         data.Event.insert(
             data.Event(creator=user,**event)
         )
         .returning(*data.Event.all_columns()) # Return full record
     )
 
+    cache.invalidate(query[0]) # Any cached pages this event lands in
+
     return query[0] #! Is there a more graceful way to do this?
 
 
+@event_router.post("/bulk", response_model=api.BulkResult)
+async def create_events(
+    request: Request,
+    user: int = Depends(authenticate)) -> api.BulkResult:
+    """Create up to `BULK_LIMIT` events at once (a JSON array, or NDJSON)
+
+    > ✅ One transaction (and one `fsync`) for the whole lot, see `planner/bulk.py`
+    > ⚠️ We read the raw body ourselves, so `/docs` can't show an example
+
+    Each item is validated like `POST /events/`. Invalid items are reported by
+    their `index` (with Pydantic's `errors`), and the valid ones are still created.
+    If the insert itself fails, nothing is created (and you get the error).
+
+    1. ❌ Not a JSON array (or NDJSON with `Content-Type: application/x-ndjson`) (400)
+    2. ❌ More than `BULK_LIMIT` events (413)
+    """
+    ndjson = bulk.is_ndjson(request.headers.get("content-type", ""))
+    items = bulk.parse_items(await request.body(), ndjson)
+    rows, results = bulk.validate(items, user)
+
+    inserted = await write(*bulk.insert_queries(rows)) if rows else []
+
+    if inserted:
+        cache.invalidate_all() # Cheaper than checking every row (see `planner/bulk.py`)
+
+    return bulk.report(results, inserted)
+
+
 # ------------------------------------------------------------------------------
 # Delete routes (destructive actions)
 # ==============================================================================
@@ -277,12 +544,14 @@ async def delete_event(id: str, user: int = Depends(authenticate)) -> dict:
     2. <s>⚠️ User who doesn't own data tried to delete it</s> (we've handled this)
     3. <s>👩‍🦳 "Does not have permission to delete"</s> (we're not checking this properly)
     """
-    query = await (
+    event_id = parse_id(id)
+
+    query = [] if event_id is None else await write(
         data.Event.delete()
         .where(
-            (data.Event.id == id) & (data.Event.creator == user)
+            (data.Event.public_id == event_id.bytes) & (data.Event.creator == user)
         )
-        .returning(data.Event.id) #! Use this instead of `id`?
+        .returning(*data.Event.all_columns()) # Sort values for the cache
     )
 
     if not query: # Is an empty list?
@@ -291,6 +560,8 @@ async def delete_event(id: str, user: int = Depends(authenticate)) -> dict:
             detail=f"Event with supplied ID: {id} does not exist"
         )
 
+    cache.invalidate(query[0], deleted=True)
+
     return { "message": f"Event with ID# {id} deleted!" }
 
 
@@ -0,0 +1,47 @@
+# ------------------------------------------------------------------------------
+# Our TAGS routes
+# ==============================================================================
+# > Tags live in `Event.tags`, but are counted from our indexed `event_tag`
+# > lookup table (see `planner/tags.py`).
+#
+# Use these to build a tag cloud (or filter list) on the client, then pass the
+# tags to `/events/?tag=...` to filter events.
+
+from fastapi import APIRouter, Depends, Query
+
+import planner.models.tags as api # api.TagCount
+import planner.tables as data # data.Event
+from planner.engine import use_reader
+import planner.event_cache as cache
+from planner.tags import COUNTS
+
+from typing import Annotated, List
+
+
+tag_router = APIRouter(
+    tags=["Tags"] # used for `/redoc` (menu groupings)
+)
+
+
+# ------------------------------------------------------------------------------
+# Read routes
+# ==============================================================================
+
+@tag_router.get("/", response_model=List[api.TagCount], dependencies=[Depends(use_reader)])
+async def retrieve_all_tags(
+        limit: Annotated[int, Query(ge=1, le=1000)] = 100
+    ) -> List[api.TagCount]:
+    """The most used tags (and how many events have each), most used first.
+
+    > Cached until the next event write (see `planner/event_cache.py`)
+    """
+    key = cache.tags_key(limit)
+    entry = cache.lookup(key)
+
+    if entry is not None:
+        return entry["value"]
+
+    seen_version = cache.version
+    tags = await data.Event.raw(COUNTS, limit)
+
+    return cache.store(key, tags, seen_version)["value"]
@@ -46,21 +46,27 @@
 # ------------------------------------------------------------------------------
 # WISHLIST
 # ------------------------------------------------------------------------------
-# 1. 👩‍🦳 Fix the `/me` endpoint to split `User` from `List[Event]`
+# 1. <s>👩‍🦳 Fix the `/me` endpoint to split `User` from `List[Event]`</s> ✅
 # 2. ⭐️ Figure out how to `/signin` with Elm and CURL
 # 3. ⚠️ Check the error status code and create custom one
 # 4. Use a `TypedDictionary` for the `/signin` response type?
 # 5. Change `username` to `public` UUID for JWT?
 
-from auth.authenticate import authenticate
+from auth import passwords
+from auth.authenticate import authenticate, authenticate_admin
 from auth.jwt_handler import create_access_token
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.security import OAuth2PasswordRequestForm
 
 from piccolo.apps.user.tables import BaseUser
 import planner.tables as data
 import planner.models.events as api
-from planner.models.users import User, TokenResponse
+from planner import responses
+from planner.cursors import decode_cursor, encode_cursor, keyset
+from planner.engine import use_reader
+from planner.models.users import ProfilePage, User, TokenResponse
+
+from typing import Annotated
 
 user_router = APIRouter(
     tags=["User"]  # used for `/redoc` (menu groupings)
@@ -84,6 +90,8 @@ async def sign_new_user(data: User) -> dict:
     your app is a startup, you could use an invite-only system and manually create
     users with Piccolo's CLI.
 
+    > ✅ The password is hashed off the event loop (see `auth/passwords.py`)
+
     Exceptions
     ----------
     > This is the only endpoint we're "properly" dealing with errors!
@@ -105,12 +113,14 @@ async def sign_new_user(data: User) -> dict:
     7. 🛑 Account not approved by admin (change to `active=False` if needed)
     """
     try:
-        new_user = await BaseUser.create_user(
+        new_user = await passwords.create_user(
             username=data.username,
             email=data.email,
             password=data.password,
             active=True #! (4)
         )
+    except HTTPException: # Too busy hashing (503)
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=409,
@@ -134,8 +144,12 @@ async def sign_in_user(data: OAuth2PasswordRequestForm = Depends()):
     > @ https://blog.usebruno.com/oauth-2.0-secure-api-access-using-bruno
     
     Types are a bit of a problem at the moment with Oauth.
+    `passwords.login()` returns the user `id`, which we add to the JWT.
+
+    > ✅ Same as `BaseUser.login()`, but the password is hashed off the event
+    > loop. A sign in storm gets `503`s rather than freezing the API.
     """
-    user = await BaseUser.login(
+    user = await passwords.login(
         username=data.username,
         password=data.password
     )
@@ -146,7 +160,7 @@ async def sign_in_user(data: OAuth2PasswordRequestForm = Depends()):
             detail="User doesn't exist or password is incorrect" #! 403? 401?
         )
 
-    access_token = create_access_token(data.username)
+    access_token = create_access_token(data.username, user)
 
     return {
         "access_token": access_token, # (5)
@@ -154,8 +168,26 @@ async def sign_in_user(data: OAuth2PasswordRequestForm = Depends()):
     }
 
 
-@user_router.get("/me")
-async def retrieve_user_profile(user: int = Depends(authenticate)):
+@user_router.get("/hashing/stats")
+async def retrieve_hashing_stats(user: int = Depends(authenticate_admin)) -> dict:
+    """Password hashes, and how long they waited for a worker (admins only).
+
+    > The queue depth tells anyone how close a login storm is to our `503`s, so
+    > it's not public (see `auth/passwords.py`).
+    """
+    return passwords.stats()
+
+
+ME_PAGE_SIZE = 50 # Default `?limit=` (some users have thousands of events)
+ME_PAGE_LIMIT = 500
+
+
+@user_router.get("/me", response_model=ProfilePage, dependencies=[Depends(use_reader)])
+async def retrieve_user_profile(
+    fields: Annotated[str | None, Query(max_length=200)] = None,
+    cursor: Annotated[str | None, Query(max_length=512)] = None,
+    limit: Annotated[int, Query(ge=1, le=ME_PAGE_LIMIT)] = ME_PAGE_SIZE,
+    user: int = Depends(authenticate)) -> ProfilePage:
     """Retrieve user profile and all their events
     
     > ⚠️ Extra care should be taken to ensure only current user events
@@ -168,16 +200,49 @@ async def retrieve_user_profile(user: int = Depends(authenticate)):
     
     Joins
     -----
-    > Piccolo full joins behind the scenes, so you can access columns.
+    > ✅ No join! `{ user, events, next }` has the user ONCE.
+
+    We used to `select(Event.creator.username, ...)`, which repeated the user in
+    every event (and joined `piccolo_user` for every row). Now it's two queries:
+    the user (by primary key), then a page of their events, which only reads the
+    `event` table (with the `event_creator` index, see `planner/schema.py`).
 
-    Unfortunately we've got a repeating user profile in each event. Ideally,
-    we'd want to have a dictionary of `User` and _then_ the `List[Event]`. To do
-    that we could (a) manipulate the current data, (b) use raw SQL, (c) create
-    our own custom `join_on`, or (d) grab the `User` first, then the `List[Event]`.
+    Pagination
+    ----------
+    > Same as `/events/`: send `next` back as `?cursor=` for more events
+
+    Events are in the order they were created.
+
+    Sparse fieldsets
+    ----------------
+    > `?fields=title,location` only reads (and sends) those event fields (plus
+    > the `public_id`), like `/events/`. See `planner/responses.py`.
     """
-    return await (
-        data.Event.select(
-            data.Event.creator.username,
-            data.Event.all_columns()
-        ).where(data.Event.creator == user)
+    fields = responses.parse_fields(fields)
+
+    profile = await (
+        BaseUser.select(BaseUser.username, BaseUser.email)
+        .where(BaseUser.id == user)
+        .first()
     )
+
+    query = (
+        data.Event.select(data.Event.id, *responses.columns(fields)) # Never `creator`
+        .where(data.Event.creator == user)
+        .order_by(data.Event.id)
+        .limit(limit + 1) # One extra row tells us if there's a next page
+    )
+
+    if cursor:
+        _, id = decode_cursor("me", cursor)
+        query = query.where(keyset(data.Event.id, data.Event.id, id, id))
+
+    events = await query
+    page, extra = events[:limit], events[limit:]
+    next_cursor = encode_cursor("me", None, page[-1]["id"]) if extra else None
+
+    return responses.json_response(responses.dumps({
+        "user": profile,
+        "events": responses.events(page, fields),
+        "next": next_cursor
+    }))
@@ -0,0 +1,148 @@
+# ------------------------------------------------------------------------------
+# Schema extras (indexes, etc)
+# ==============================================================================
+# > Piccolo's `create_db_tables` builds our tables and single column indexes,
+# > but anything more advanced must be raw SQL.
+#
+# We're not using Piccolo migrations (see `planner/piccolo_app.py`), so extra
+# schema objects are created with `IF NOT EXISTS` on every startup. It's safe to
+# run against an existing `planner.db` and costs next to nothing.
+#
+#
+# Sort indexes
+# ------------
+# > Each sort order needs it's own `(column, id)` index for keyset pagination.
+#
+# `Event.id` is an `INTEGER PRIMARY KEY` (the `rowid`), and every SQLite index
+# already ends with the `rowid`. So an index on `title` alone IS a `(title, id)`
+# index, without storing the `id` twice. See `planner/cursors.py` for more.
+#
+# `Event.creator` gets one too: a user's events (in `id` order) for `/users/me`.
+# Piccolo doesn't index a `ForeignKey` for us in SQLite (it'd be a full scan).
+#
+#     @ https://www.sqlite.org/queryplanner.html#sorting
+#
+#
+# Generation counter
+# ------------------
+# > A single row that's bumped (by triggers) whenever an `event` is written.
+#
+# Every worker checks it to know when it's event cache is out of date. Triggers
+# catch EVERY write, even raw SQL from the admin. See `planner/coherence.py`.
+#
+#
+# Full-text search
+# ----------------
+# > An FTS5 index (and it's triggers), see `planner/search.py`
+#
+# The index is filled from any existing events the first time it's created, after
+# that the triggers keep it up to date. An FTS5 table's options can't be changed,
+# so an index with different `prefix=` options is dropped and rebuilt.
+#
+#
+# Tags
+# ----
+# > An indexed `event_tag` lookup table (and it's triggers), see `planner/tags.py`
+#
+# Filled (and kept up to date) the same way as our full-text search. Tags that
+# older triggers stored differently are fixed every time (`RENORMALISE`).
+#
+#
+# Triggers
+# --------
+# > `CREATE TRIGGER IF NOT EXISTS` never changes a trigger that's already there
+#
+# So any trigger that's different to ours is dropped and created again (in one
+# transaction, so no write can slip in between without it).
+#
+#
+# Coordinates
+# -----------
+# > An R*Tree index of events with a `latitude` and `longitude` (`planner/geo.py`)
+#
+# Older databases get the two new columns with `ALTER TABLE ... ADD COLUMN`.
+#
+#
+# Event IDs
+# ---------
+# > Older databases have `UUID` primary keys, which are converted to a `Serial()`
+# > ID (and a `UUID7()` public ID) BEFORE anything else (`planner/migrate_ids.py`)
+
+from piccolo.table import create_db_tables
+from planner import geo
+from planner.migrate_ids import migrate_ids
+from planner.search import PREFIX, REBUILD, SEARCH
+from planner.tags import BACKFILL, RENORMALISE, TAGS
+from planner.tables import Event
+
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS event_title ON "event" ("title")', # (title, id)
+    'CREATE INDEX IF NOT EXISTS event_location ON "event" ("location")', # (location, id)
+    'CREATE INDEX IF NOT EXISTS event_creator ON "event" ("creator")', # (creator, id) for `/users/me`
+]
+
+GENERATION = [
+    'CREATE TABLE IF NOT EXISTS planner_generation (id INTEGER PRIMARY KEY CHECK (id = 1), n INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO planner_generation (id, n) VALUES (1, 0)',
+] + [
+    f'CREATE TRIGGER IF NOT EXISTS event_generation_{action.lower()} AFTER {action} ON "event" '
+    'BEGIN UPDATE planner_generation SET n = n + 1 WHERE id = 1; END'
+    for action in ("INSERT", "UPDATE", "DELETE")
+]
+
+
+async def create_schema():
+    """Create our tables (if they don't exist) and any extras.
+
+    > Also sets the `journal_mode` PRAGMA (see `planner/engine.py`)
+    """
+    await Event._meta.db.prep_database()
+    migrate_ids(Event._meta.db.path)
+    await create_db_tables(Event, if_not_exists=True)
+
+    columns = {column["name"] for column in await Event.raw('PRAGMA table_info("event")')}
+    for name, ddl in geo.COLUMNS.items():
+        if name not in columns:
+            await Event.raw(ddl)
+
+    for ddl in INDEXES + GENERATION:
+        await Event.raw(ddl)
+
+    search = await Event.raw(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'event_search'"
+    )
+    if search and f"prefix='{PREFIX}'" not in search[0]["sql"]:
+        await Event.raw("DROP TABLE event_search") # Rebuilt below
+
+    for table, ddls, first_time in [
+        ("event_search", SEARCH, REBUILD),
+        ("event_tag", TAGS, BACKFILL),
+        ("event_geo", geo.GEO, geo.BACKFILL),
+    ]:
+        exists = await Event.raw(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = {}", table
+        )
+        for ddl in ddls if exists else ddls + first_time:
+            await Event.raw(ddl)
+
+    await replace_changed_triggers(GENERATION + SEARCH + TAGS + geo.GEO)
+
+    for ddl in RENORMALISE: # After the tag triggers are up to date
+        await Event.raw(ddl)
+
+
+async def replace_changed_triggers(ddls: list[str]):
+    """Drop and create again any of these triggers that aren't the same as ours"""
+    for ddl in ddls:
+        if not ddl.startswith("CREATE TRIGGER IF NOT EXISTS "):
+            continue
+
+        name = ddl.split()[5]
+        rows = await Event.raw(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = {}", name
+        )
+        if rows and rows[0]["sql"] != ddl.replace(" IF NOT EXISTS", "", 1):
+            async with Event._meta.db.transaction():
+                await Event.raw(f"DROP TRIGGER {name}")
+                await Event.raw(ddl)
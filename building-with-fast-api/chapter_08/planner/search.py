@@ -0,0 +1,240 @@
+# ------------------------------------------------------------------------------
+# Full-text search (SQLite FTS5)
+# ==============================================================================
+# > "Electronic dance music tonight" shouldn't mean downloading every event and
+# > filtering on the client! (see `PROBLEM.md`)
+# > @ https://www.sqlite.org/fts5.html
+#
+# `event_search` is an FTS5 index over `Event.title`, `description` and `location`.
+# It's an "external content" table: it only holds the index, and reads the text
+# itself from `event` (by `rowid`), so we don't store every description twice.
+#
+# 1. Triggers keep it in sync with EVERY write (our writer, or raw admin SQL)
+# 2. It's rebuilt from `event` the first time it's created (see `planner/schema.py`)
+# 3. Words are stemmed (`porter`), so "dancing" matches "dance"
+# 4. The LAST word is a prefix (`danc*`), as the user may still be typing it
+#
+#
+# Ranking
+# -------
+# > Lower `rank` is better (BM25 scores are negative in SQLite)
+#
+# The default `rank` is `bm25()` with our column weights: a match in the `title`
+# counts 10x a match in the `description`, and a `location` match counts 5x.
+#
+#
+# Pagination
+# ----------
+# > Same keyset pagination as our other lists (see `planner/cursors.py`)
+#
+# We order by `(rank, rowid)` and the cursor holds the last pair we sent (plus
+# the "window" it came from, see below). BM25 scores depend on the whole table, so
+# a write in between pages can shuffle them a little. That's fine for search results!
+#
+#
+# Speed
+# -----
+# > Aim for less than 10ms, even with a million events. We DON'T, for common
+# > words (14-21ms, see the table below), and ranking is only approximate.
+#
+# Finding matches is fast, but FTS5 must SCORE every match to sort by `rank` (and
+# that's roughly 10-20µs each). A common word in a million events could be 100k+
+# matches, which is over a second! So we rank them in "windows" of
+# `SEARCH_CANDIDATES` matches, newest first:
+#
+# 1. Find the `rowid` of the Nth newest match (walks the index, no scoring)
+# 2. Rank everything from that `floor` upwards (at most N scores)
+# 3. When that window runs out, the next N older matches are the next window
+#    (from a new `floor` up to the old one), and so on until there's none left
+#
+# So EVERY match is found (by paging far enough), but BM25 only ranks matches
+# against the others in their window. A match in an older window comes after
+# every match in the newer ones, however good it is, so the best match overall
+# is only first if it's in the newest window. Newer events are usually the ones
+# people are looking for! The window is kept in the cursor, so every page ranks
+# the same set of matches. All search words must match (`AND`) and very short
+# words are ignored, both of which help.
+#
+#
+# Prefixes
+# --------
+# > Our last word is a prefix (`jazz*`), which is a search for EVERY word that
+# > starts with it (`jazz`, `jazzy`, `jazzercise` ...) merged together.
+#
+# `prefix='2 3 4'` also indexes the first 2, 3 and 4 letters of every word, so a
+# prefix of up to 4 letters is ONE lookup rather than a merge (it makes the index
+# bigger). Longer prefixes still merge, but there are far fewer words to merge.
+# Older databases have their index rebuilt with it (see `planner/schema.py`).
+#
+# Timings on a million fake events, where the most common words are in ~30% of
+# them (a worst case):
+#
+#     | `?q=`          | Matches | All ranked | 500 newest ranked | And `prefix='2 3 4'` |
+#     | -------------- | ------- | ---------- | ----------------- | -------------------- |
+#     | `w19999`       | 214     | 1ms        | 1ms               | 1ms                  |
+#     | `w1234`        | ~7k     | 29ms       | 4ms               | 4ms                  |
+#     | `vinyl poetry` | ~12k    | 70ms       | 21ms              | 21ms                 |
+#     | `jazz`         | ~283k   | 614ms      | 50ms              | 14ms                 |
+#
+# ⚠️ The index is ~20% bigger, and we still miss 10ms for common words: `jazz` is
+# 14ms and `vinyl poetry` is 21ms. A long prefix (`poetry*`) still merges, and
+# the time goes on reading the matches, not ranking them (100 candidates rather
+# than 500 only gets `jazz` to ~10ms, and `vinyl poetry` to ~20ms).
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. An old event that's a great match is only found after the newer windows
+# 2. Should search results be cached too? (see `planner/event_cache.py`)
+# 3. `snippet()` markers are NOT html escaped (the client must escape the text)
+
+from decouple import config
+from fastapi import HTTPException
+from planner.cursors import decode_cursor, encode_cursor
+from planner.tables import Event
+
+import re
+
+
+CANDIDATES = config("SEARCH_CANDIDATES", default=500, cast=int) # Matches ranked at once
+PREFIX = "2 3 4" # Prefix indexes (a change rebuilds `event_search`, see `planner/schema.py`)
+MIN_WORD = 2 # Shorter words match far too much (with prefixes)
+MAX_WORDS = 8
+
+SEARCH = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS event_search USING fts5('
+    'title, description, location, '
+    "content='event', content_rowid='rowid', "
+    f"tokenize='porter unicode61 remove_diacritics 2', prefix='{PREFIX}')",
+
+    'CREATE TRIGGER IF NOT EXISTS event_search_insert AFTER INSERT ON "event" BEGIN '
+    'INSERT INTO event_search (rowid, title, description, location) '
+    'VALUES (new.rowid, new.title, new.description, new.location); END',
+
+    'CREATE TRIGGER IF NOT EXISTS event_search_delete AFTER DELETE ON "event" BEGIN '
+    "INSERT INTO event_search (event_search, rowid, title, description, location) "
+    "VALUES ('delete', old.rowid, old.title, old.description, old.location); END",
+
+    'CREATE TRIGGER IF NOT EXISTS event_search_update AFTER UPDATE ON "event" BEGIN '
+    "INSERT INTO event_search (event_search, rowid, title, description, location) "
+    "VALUES ('delete', old.rowid, old.title, old.description, old.location); "
+    'INSERT INTO event_search (rowid, title, description, location) '
+    'VALUES (new.rowid, new.title, new.description, new.location); END',
+]
+
+# Only run when `event_search` is first created
+REBUILD = [
+    "INSERT INTO event_search (event_search) VALUES ('rebuild')",
+    "INSERT INTO event_search (event_search, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0)')",
+]
+
+SELECT = (
+    'SELECT "event".*, event_search.rank AS rank, event_search.rowid AS rowid, '
+    "snippet(event_search, -1, '<mark>', '</mark>', '…', 12) AS snippet "
+    'FROM event_search JOIN "event" ON "event".rowid = event_search.rowid '
+    'WHERE event_search MATCH {}'
+)
+
+
+def match_query(q: str) -> str:
+    """Turn the user's words into a safe FTS5 query (or raise a `400`).
+
+    > Never pass `?q=` straight to `MATCH`: quotes, `OR`, `NEAR` and `*` are
+    > all FTS5 syntax (and a syntax error is a `500`).
+
+    `electronic danc` -> `"electronic" "danc"*` (both words, the last as a prefix)
+    """
+    words = [word for word in re.findall(r"\w+", q.lower()) if len(word) >= MIN_WORD]
+
+    if not words:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Search needs at least one word of {MIN_WORD}+ letters"
+        )
+
+    words = [f'"{word}"' for word in words[:MAX_WORDS]]
+    return " ".join(words) + "*"
+
+
+async def candidates_floor(match: str, ceiling: int | None = None) -> int:
+    """The `rowid` of the `CANDIDATES`th newest match below `ceiling` (`0` if there's fewer)"""
+    sql, values = "SELECT rowid FROM event_search WHERE event_search MATCH {}", [match]
+
+    if ceiling is not None:
+        sql += " AND rowid < {}"
+        values.append(ceiling)
+
+    rows = await Event.raw(sql + " ORDER BY rowid DESC LIMIT 1 OFFSET {}", *values, CANDIDATES - 1)
+    return rows[0]["rowid"] if rows else 0
+
+
+def decode_search_cursor(cursor: str) -> tuple:
+    """Decode a search cursor into `(floor, ceiling, rank, rowid)` or raise a `400`."""
+    value, rowid = decode_cursor("search", cursor)
+
+    if (
+        not isinstance(value, list) or len(value) != 3
+        or not isinstance(value[1], (int, type(None)))
+        or not all(isinstance(number, (int, float)) for number in [value[0], value[2], rowid])
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor for this query"
+        )
+
+    return value[0], value[1], value[2], rowid
+
+
+def search(match: str, floor: int, ceiling: int | None, limit: int, after: tuple | None = None):
+    """Raw query for a page of results in one window, ordered by `(rank, rowid)`.
+
+    > `after` is the `(rank, rowid)` of the last result (from the cursor)
+    """
+    sql, values = SELECT + " AND event_search.rowid >= {}", [match, floor]
+
+    if ceiling is not None:
+        sql += " AND event_search.rowid < {}"
+        values.append(ceiling)
+
+    if after is not None:
+        sql += " AND (event_search.rank, event_search.rowid) > ({}, {})"
+        values += after
+
+    sql += " ORDER BY event_search.rank, event_search.rowid LIMIT {}"
+    return Event.raw(sql, *values, limit)
+
+
+async def search_page(match: str, limit: int, cursor: str | None = None) -> tuple[list, str | None]:
+    """Up to `limit` results, and the cursor for the next page (or `None`).
+
+    > Carries on into older windows until the page is full (or there's no more
+    > matches), so nothing is left out. That's two windows at most, unless
+    > `limit` is more than `CANDIDATES`.
+
+    ⚠️ Ranking is only by BM25 WITHIN a window, so results are best first for the
+    newest `CANDIDATES` matches, then the next, and so on (not across them all).
+    """
+    if cursor:
+        floor, ceiling, rank, rowid = decode_search_cursor(cursor)
+        after = (rank, rowid)
+    else:
+        ceiling, after = None, None
+        floor = await candidates_floor(match)
+
+    rows, windows = [], []
+    while True:
+        found = await search(match, floor, ceiling, limit + 1 - len(rows), after) # One extra row for `next`
+        rows += found
+        windows += [[floor, ceiling]] * len(found)
+
+        if len(rows) > limit or floor == 0:
+            break
+        ceiling, after = floor, None # The next (older) window
+        floor = await candidates_floor(match, ceiling)
+
+    if len(rows) <= limit:
+        return rows, None
+
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor("search", windows[limit - 1] + [last["rank"]], last["rowid"])
@@ -0,0 +1,181 @@
+# ------------------------------------------------------------------------------
+# Slow query log
+# ==============================================================================
+# > `SQLITE_LOG_QUERIES` prints EVERY query, which is far too noisy to leave on.
+# > We only want the slow ones (and why they're slow).
+#
+# Any query that takes longer than `SLOW_QUERY_MS` is recorded against it's
+# "fingerprint": the SQL with every value taken out, so `WHERE id = 1` and
+# `WHERE id = 2` are the same query. For each fingerprint we keep:
+#
+# 1. How many times it was slow, and the total and slowest time
+# 2. The most rows it returned (lots of rows is slow, see `PERFORMANCE.md`)
+# 3. Which routes ran it (`/events/{id}`), and how often
+# 4. It's `EXPLAIN QUERY PLAN` (worked out once, the first time it's slow)
+#
+# Admins can see the worst ones at `GET /admin/slow-queries` (see
+# `planner/routes/admin.py`), sorted by total time (`?sort=max` or `count`).
+#
+# ```
+# SLOW_QUERY_MS=100       # Anything slower is recorded (0 records everything)
+# SLOW_QUERY_LIMIT=500    # Fingerprints we keep (new ones are dropped after that)
+# ```
+#
+#
+# Scans and seeks
+# ---------------
+# > "SCAN event" reads the whole table. "SEARCH event USING INDEX" doesn't.
+#
+#     @ https://www.sqlite.org/eqp.html
+#
+# Each fingerprint lists the `scans` in it's plan, so a query that needs an index
+# stands out (a `SCAN ... USING COVERING INDEX` still reads every row, just of a
+# smaller index). The plan is run on a connection of it's own, in the background,
+# so it never slows down the request that was already slow.
+#
+#
+# Routes
+# ------
+# > The middleware in `main.py` tells us which request we're in.
+#
+# Writes run in the writer task (see `planner/writer.py`), which passes the
+# request along with each job. Queries outside of a request (startup, scripts)
+# have no route.
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Write them to a log file as well (`logging`), for after a restart
+# 2. Each `uvicorn --workers` has it's own log (like `planner/metrics.py`)
+
+from asyncio import Task, create_task
+from contextvars import ContextVar
+from decouple import config
+from piccolo.querystring import QueryString
+from planner.metrics import UNMATCHED, route_template
+
+import re
+import time
+
+
+THRESHOLD = config("SLOW_QUERY_MS", default=100, cast=float) / 1000 # seconds
+LIMIT = config("SLOW_QUERY_LIMIT", default=500, cast=int) # Fingerprints
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)") # `IN (?, ?, ?)` and `VALUES (?, ?)`
+_ROWS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+") # Multi-row `VALUES`
+_SPACES = re.compile(r"\s+")
+
+request_scope: ContextVar[dict | None] = ContextVar("slow_query_request", default=None)
+
+_queries: dict[str, dict] = {} # fingerprint: stats
+_dropped = {"queries": 0}
+_explaining: set[Task] = set() # Keep a reference (or they can be garbage collected)
+
+
+def fingerprint(sql: str) -> str:
+    """The SQL without it's values (literals, `?` lists and `VALUES` rows)"""
+    sql = _STRINGS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    sql = _LISTS.sub("(...)", sql)
+    sql = _ROWS.sub("(...)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+def check(engine, querystring: QueryString, response, seconds: float):
+    """Record the query if it was slow (called by `planner/engine.py`)"""
+    if seconds < THRESHOLD:
+        return
+
+    sql, args = querystring.compile_string(engine_type=engine.engine_type)
+    key = fingerprint(sql)
+    query = _queries.get(key)
+
+    if query is None:
+        if len(_queries) >= LIMIT:
+            _dropped["queries"] += 1
+            return
+
+        query = _queries[key] = {
+            "fingerprint": key,
+            "count": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "max_rows": 0,
+            "routes": {},
+            "plan": None,
+            "scans": None,
+            "last_seen": None,
+        }
+        _explain_later(engine, query, sql, args)
+
+    rows = len(response) if isinstance(response, list) else 0
+    route = _route()
+
+    query["count"] += 1
+    query["total_ms"] += seconds * 1000
+    query["max_ms"] = max(query["max_ms"], seconds * 1000)
+    query["max_rows"] = max(query["max_rows"], rows)
+    query["routes"][route] = query["routes"].get(route, 0) + 1
+    query["last_seen"] = time.time()
+
+
+def top(limit: int = 20, sort: str = "total") -> dict:
+    """The worst `limit` fingerprints (by `total_ms`, `max_ms` or `count`)"""
+    field = {"total": "total_ms", "max": "max_ms", "count": "count"}[sort]
+    queries = sorted(_queries.values(), key=lambda query: query[field], reverse=True)
+
+    return {
+        "threshold_ms": THRESHOLD * 1000,
+        "fingerprints": len(_queries),
+        "dropped": _dropped["queries"],
+        "queries": [
+            {**query, "average_ms": query["total_ms"] / query["count"]}
+            for query in queries[:limit]
+        ],
+    }
+
+
+def clear():
+    _queries.clear()
+    _dropped["queries"] = 0
+
+
+def _route() -> str | None:
+    scope = request_scope.get()
+    if scope is None:
+        return None
+    return route_template(scope["path"], scope.get("route")) or UNMATCHED
+
+
+def _explain_later(engine, query: dict, sql: str, args: list):
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return
+
+    task = create_task(_explain(engine, query, sql, args))
+    _explaining.add(task)
+    task.add_done_callback(_explaining.discard)
+
+
+async def _explain(engine, query: dict, sql: str, args: list):
+    """`EXPLAIN QUERY PLAN` on a new connection (it doesn't run the query)"""
+    try:
+        connection = await engine.get_connection()
+        try:
+            async with connection.execute("EXPLAIN QUERY PLAN " + sql, args) as cursor:
+                rows = await cursor.fetchall()
+        finally:
+            await connection.close()
+    except Exception as error:
+        query["plan"] = [f"EXPLAIN failed: {error}"]
+        return
+
+    query["plan"] = [row["detail"] for row in rows]
+    query["scans"] = [
+        detail for detail in query["plan"]
+        if detail.startswith("SCAN") and "CONSTANT ROW" not in detail # `VALUES`
+    ]
@@ -72,6 +72,7 @@
 #     - Duplicate values are best handled with the DB (not the client)
 #     - PRAGMA settings like `journal_mode=WAL`, `foreign_keys`, `cache_size`,
 #       aren't available in Piccolo yet. You can set `TIMEOUT` however.
+#       We've added our own PRAGMA profiles in `planner/engine.py`.
 #
 # 2. Column types are required (`null=False`) by default, but ...
 #     - `null=True` must be used for required inputs (even foreign keys!)
@@ -85,6 +86,7 @@
 #     - Indexing increases lookup and join speed (`int` > `UUID` > `string`)
 #     - A longer `UUID` reduces chance of collisions, take care with short ones
 #     - Is there any benefit in having both `Serial` and `UUID` columns?
+#       Yes! See `planner/ids.py` (small integer joins, short public URLs)
 #       @ https://github.com/piccolo-orm/piccolo/issues/1271#issuecomment-3395347091
 #     - No need for Pydantic's `Field(default_factory=uuid)`, as our
 #       UUIDs are generated by Piccolo!
@@ -138,6 +140,8 @@
 # > Prevents hackers from blitzing by incrementing IDs. Prevents Ai scraping.
 #
 # 1. An indexed UUID can adds ~80 bytes to row size!
+#     - As 16 bytes (not a 36 character string) it's much smaller
+#     - Random UUIDs scatter inserts across the index (see `planner/ids.py`)
 # 2. You could create a custom column in Piccolo if you like
 # 3. Take care with collisions, especially short UUIDs (debatable which best)
 #     - Either shorten a `UUID` on the frontend or replace with short one
@@ -197,22 +201,28 @@
 
 from piccolo.apps.user.tables import BaseUser
 from piccolo.table import Table
-from piccolo.columns import Array, ForeignKey, Text, UUID, Varchar
+from piccolo.columns import Array, ForeignKey, Real, Serial, Text, Varchar
+from planner.ids import UUID7
 
 
 class Event(Table):
     """
-    We'll use `UUID` instead of auto-incrementing `ID` for more security.
+    We'll use a `UUID` in URLs instead of auto-incrementing `ID` for more security.
 
     > Fields are `null=False` by default (required, not optional)
 
-    Piccolo defaults to a `Serial()` auto-incrementing integer primary key, but
-    we've changed it to automatically generate a `UUID` for us.
+    We've got both! Piccolo's `Serial()` auto-incrementing integer primary key is
+    for us (joins, indexes, sort order) and is never exposed. `public_id` is a
+    time ordered (version 7) `UUID` stored as 16 bytes, shown in base62 in URLs
+    and responses. See `planner/ids.py`.
     """
-    id = UUID(primary_key=True, index=True)
+    id = Serial(primary_key=True)
+    public_id = UUID7(unique=True)
     creator = ForeignKey(references=BaseUser, target_column=BaseUser.id) #! (2)
     title = Varchar(length=255) #! (1)
     image = Varchar(length=255, null=True)
     description = Text()
     location = Varchar(length=50, null=True)
     tags = Array(base_column=Varchar(length=50), null=True) #! (2)
+    latitude = Real(null=True, default=None) # See `planner/geo.py`
+    longitude = Real(null=True, default=None)
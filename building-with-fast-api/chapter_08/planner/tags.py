@@ -0,0 +1,143 @@
+# ------------------------------------------------------------------------------
+# Event tags (an indexed lookup table)
+# ==============================================================================
+# > `Event.tags` is an `Array()`, which SQLite stores as JSON text. Filtering on
+# > it means reading (and parsing) EVERY row. That's a full table scan!
+#
+# `event_tag` is a plain many-to-many lookup table: one `(tag, event_id)` row for
+# each tag on each event (by our small integer `Event.id`, see `planner/ids.py`).
+# It's primary key is an index, so "events tagged music" is an index seek, not a
+# scan. `Event.tags` is still the source of truth:
+#
+# 1. Triggers keep `event_tag` in sync with EVERY write (through `json_each()`),
+#    so `create_event` and `delete_event` don't need to do anything extra
+# 2. It's filled from existing events the first time it's created
+# 3. Tags are lowercased (and trimmed), so "Music" and "music " are the same tag
+#
+#     @ https://www.sqlite.org/json1.html#jeach
+#
+#
+# Lowercase
+# ---------
+# > SQLite's own `lower()` only folds ASCII, so "MÜNCHEN" would be "mÜnchen"!
+#
+# `?tag=` is lowercased in Python, so every connection swaps SQLite's `lower()`
+# for `lower()` below (see `planner/engine.py`), and the triggers lowercase the
+# same way. Tags saved before that are fixed on startup (see `RENORMALISE`).
+#
+# ⚠️ The `sqlite3` shell doesn't have our `lower()`, so raw admin SQL still stores
+# non-ASCII tags with the ASCII only one (until the next restart fixes them).
+#
+#
+# Trim
+# ----
+# > SQLite's `trim()` only removes spaces, Python's `strip()` removes ALL whitespace
+#
+# Both sides trim the same `WHITESPACE` (spaces, tabs and newlines), so "music\n"
+# and "\tmusic" are "music" too. Python's `strip()` would also remove Unicode
+# spaces the triggers can't, so we never call it without `WHITESPACE`. Older
+# databases have their triggers replaced on startup (see `planner/schema.py`).
+#
+#
+# Matching tags
+# -------------
+# > `?tag=music&tag=adults` with `?match=all` (the default) or `?match=any`
+#
+# 1. `all`: events with EVERY tag (grouped by event, counting matched tags)
+# 2. `any`: events with AT LEAST ONE of the tags
+#
+# Both are a subquery on `event_tag` that only touches the index.
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Should `Event.tags` become a proper `ForeignKey` (see `planner/tables.py`)?
+# 2. Tag counts are cached, but counting is a full scan of `event_tag`
+#     - A `tag_count` table (also kept by triggers) would make it instant
+
+from piccolo.columns.combination import WhereRaw
+from typing import Literal
+
+
+MAX_TAGS = 10 # Per query (`?tag=`)
+
+Match = Literal["all", "any"]
+
+WHITESPACE = " \t\n\v\f\r"
+TRIM = f"trim({{}}, char({', '.join(str(ord(character)) for character in WHITESPACE)}))"
+KEY = "lower(" + TRIM + ")" # A tag as it's stored in `event_tag` (SQL)
+
+TAGS = [
+    'CREATE TABLE IF NOT EXISTS event_tag ('
+    'tag TEXT NOT NULL, event_id INTEGER NOT NULL, PRIMARY KEY (tag, event_id)'
+    ') WITHOUT ROWID',
+
+    'CREATE INDEX IF NOT EXISTS event_tag_event_id ON event_tag (event_id)',
+
+    'CREATE TRIGGER IF NOT EXISTS event_tag_insert AFTER INSERT ON "event" BEGIN '
+    'INSERT OR IGNORE INTO event_tag (tag, event_id) '
+    f'SELECT {KEY.format("value")}, new.id FROM json_each(new.tags) WHERE json_valid(new.tags); END',
+
+    'CREATE TRIGGER IF NOT EXISTS event_tag_delete AFTER DELETE ON "event" BEGIN '
+    'DELETE FROM event_tag WHERE event_id = old.id; END',
+
+    'CREATE TRIGGER IF NOT EXISTS event_tag_update AFTER UPDATE OF id, tags ON "event" BEGIN '
+    'DELETE FROM event_tag WHERE event_id = old.id; '
+    'INSERT OR IGNORE INTO event_tag (tag, event_id) '
+    f'SELECT {KEY.format("value")}, new.id FROM json_each(new.tags) WHERE json_valid(new.tags); END',
+]
+
+# Tags saved by SQLite's ASCII only `lower()`, or with tabs and newlines around
+# them (`GLOB` skips the printable ASCII ones, without calling our `lower()` at all)
+_UNNORMALISED = f"tag GLOB '*[^ -~]*' AND tag <> {KEY.format('tag')}"
+
+RENORMALISE = [
+    f"UPDATE OR IGNORE event_tag SET tag = {KEY.format('tag')} WHERE {_UNNORMALISED}",
+    f"DELETE FROM event_tag WHERE {_UNNORMALISED}", # Already there
+]
+
+# Only run when `event_tag` is first created
+BACKFILL = [
+    'INSERT OR IGNORE INTO event_tag (tag, event_id) '
+    f'SELECT {KEY.format("value")}, "event".id FROM "event", json_each("event".tags) '
+    'WHERE json_valid("event".tags)',
+]
+
+COUNTS = (
+    'SELECT tag, count(*) AS count FROM event_tag '
+    'GROUP BY tag ORDER BY count DESC, tag LIMIT {}'
+)
+
+
+def lower(value):
+    """Python's (Unicode) `lower()` for SQLite, which is `NULL` for `NULL`"""
+    return None if value is None else str(value).lower()
+
+
+def normalise(tags: list[str] | None) -> tuple[str, ...]:
+    """Lowercase, trim, dedupe and sort (so the same filter has one cache key)"""
+    return tuple(sorted({
+        tag.strip(WHITESPACE).lower() for tag in tags or [] if tag.strip(WHITESPACE)
+    }))
+
+
+def tag_filter(tags: tuple[str, ...], match: Match) -> WhereRaw:
+    """Where clause for events with `all` (or `any`) of these (normalised) tags."""
+    placeholders = ", ".join("{}" for _ in tags)
+    subquery = f"SELECT event_id FROM event_tag WHERE tag IN ({placeholders})"
+
+    if match == "all" and len(tags) > 1:
+        subquery += " GROUP BY event_id HAVING count(*) = {}"
+        return WhereRaw(f'"event"."id" IN ({subquery})', *tags, len(tags))
+
+    return WhereRaw(f'"event"."id" IN ({subquery})', *tags)
+
+
+def has_tags(row_tags: list[str] | None, tags: tuple[str, ...], match: Match) -> bool:
+    """Would this row show up with this tag filter? (for cache invalidation)"""
+    if not tags:
+        return True
+
+    found = set(normalise(row_tags)) & set(tags)
+    return len(found) == len(tags) if match == "all" else bool(found)
@@ -0,0 +1,109 @@
+# ------------------------------------------------------------------------------
+# Server timing (where did the time go?)
+# ==============================================================================
+# > A single `app;dur=` can't tell you if a slow request was slow in `authenticate`,
+# > in SQLite, or turning rows into JSON.
+#
+# Each request gets it's own timings (a `ContextVar`, set by the middleware in
+# `main.py`). The slow bits add to them as they go:
+#
+# 1. `auth`: the `authenticate()` dependency (see `auth/authenticate.py`)
+# 2. `db`: every query (see `planner/engine.py`), and waiting on the writer (see
+#    `planner/writer.py`), with the number of queries as it's `desc`
+# 3. `hash`: password hashing, including the wait for a worker (see `auth/passwords.py`)
+# 4. `ser`: serialising JSON with orjson (see `planner/responses.py`)
+# 5. `gzip` or `br`: compressing the response (see `planner/compression.py`)
+# 6. `total`: the whole request (always last)
+#
+# Only the phases a request actually used are sent, in milliseconds (with three
+# decimal places, so sub-millisecond queries don't show up as `0`):
+#
+# ```
+# Server-Timing: auth;dur=0.041, db;dur=1.207;desc="2 queries", ser;dur=0.112, total;dur=2.034
+# ```
+#
+# Chrome's DevTools "Timing" tab draws these for you (or `curl -i` and read them).
+#
+#     @ https://developer.mozilla.org/en-US/docs/Web/HTTP/Reference/Headers/Server-Timing
+#     @ https://www.w3.org/TR/server-timing/
+#
+#
+# Overlaps
+# --------
+# > Phases are NOT slices of `total`, so don't add them up!
+#
+# `auth` includes it's own `db` query (when the user isn't cached), and a route
+# might run two queries at once. Whatever's left over is FastAPI itself (and any
+# `response_model=` validation, for routes that still use it).
+#
+#
+# Cost
+# ----
+# > Two `perf_counter()` calls and a dict update per phase (nothing to worry about)
+#
+# Outside of a request (a script, the shell, the writer task) there are no
+# timings, and `record()` does nothing.
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Only send `Server-Timing` to admins? (it tells the world how slow we are)
+# 2. Time the `response_model=` validation on it's own (a custom `APIRoute`?)
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+import time
+
+
+timings: ContextVar[dict | None] = ContextVar("server_timing", default=None)
+
+
+def start() -> dict:
+    """New (empty) timings for this request: `{ name: [seconds, count] }`"""
+    phases = {}
+    timings.set(phases)
+    return phases
+
+
+def record(name: str, seconds: float, count: int = 1):
+    phases = timings.get()
+    if phases is None:
+        return
+
+    phase = phases.setdefault(name, [0.0, 0])
+    phase[0] += seconds
+    phase[1] += count
+
+
+@contextmanager
+def measure(name: str, count: int = 1) -> Iterator[None]:
+    """Time the `with` block as part of a phase (errors are still timed)"""
+    phases = timings.get()
+    if phases is None:
+        yield
+        return
+
+    phases.setdefault(name, [0.0, 0]) # Listed in the order they started
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start_time, count)
+
+
+def header(phases: dict, total: float) -> str:
+    """The `Server-Timing` header value (milliseconds, `total` last)"""
+    metrics = [
+        f'{name};dur={seconds * 1000:.3f};desc="{_plural(count, "query", "queries")}"'
+        if name == "db" else f"{name};dur={seconds * 1000:.3f}"
+        for name, (seconds, count) in phases.items()
+    ]
+    metrics.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(metrics)
+
+
+def _plural(count: int, one: str, many: str) -> str:
+    return f"{count} {one if count == 1 else many}"
@@ -0,0 +1,176 @@
+# ------------------------------------------------------------------------------
+# A single writer (write queue)
+# ==============================================================================
+# > SQLite only ever allows ONE writer at a time, so let's only ever have one!
+# > @ https://www.sqlite.org/lockingv3.html
+#
+# Every `POST` used to open it's own connection and write transaction. At `-c 100`
+# that's 100 connections fighting over the same lock, each one retrying until it
+# gives up with "database is locked" (see `PERFORMANCE.md`).
+#
+# Now our write routes hand their query to ONE writer task (per process) with
+# an `asyncio.Queue`, and wait for their result. The writer drains whatever is
+# waiting in the queue (up to `WRITER_BATCH_SIZE`) and commits them together in
+# a single `IMMEDIATE` transaction:
+#
+# 1. Fewer lock fights (one connection per process, not one per request)
+# 2. Fewer `fsync`s (a group of inserts share one commit)
+# 3. Under light load a batch is just one query (no waiting around)
+#
+#
+# Each caller gets their own result
+# ---------------------------------
+# > `.returning()` rows (or the error) go back to the route that asked for them.
+#
+# Each job in a batch runs in it's own `SAVEPOINT`, so one bad insert (such as a
+# `sqlite3.IntegrityError`) is rolled back on it's own and doesn't take the rest
+# of the batch down with it. If the whole transaction fails (`BEGIN` or `COMMIT`)
+# nothing was written, and every caller in that batch gets the error.
+#
+#
+# Usage
+# -----
+# > Pass an UNAWAITED Piccolo query (the writer awaits it for you)
+#
+# ```
+# rows = await write(data.Event.insert(...).returning(data.Event.id))
+# ```
+#
+# The writer is started and stopped in the app's `lifespan` (see `main.py`). If
+# it's not running (a script, or the shell) queries run in their own transaction.
+#
+#
+# Generations
+# -----------
+# > Each transaction tells `planner/coherence.py` how the counter moved, so our
+# > own (precisely invalidated) writes don't empty the whole event cache.
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Multiple `uvicorn --workers` still have one writer EACH (so a few writers)
+# 2. Should the queue have a maximum size (and return `503` when full)?
+
+from asyncio import Future, Queue, Task, create_task, get_running_loop
+from decouple import config
+from piccolo.engine.sqlite import TransactionType
+from piccolo.query import Query
+from planner import metrics
+from planner.coherence import wrote
+from planner.slow_queries import request_scope
+from planner.tables import Event
+from planner.timing import measure
+
+import time
+
+
+BATCH_SIZE = config("WRITER_BATCH_SIZE", default=64, cast=int)
+
+_queue: Queue | None = None
+_task: Task | None = None
+
+metrics.gauge("writer_queue_depth", "Write jobs waiting for the writer",
+              lambda: _queue.qsize() if _queue is not None else 0)
+
+
+async def start_writer():
+    """Start the writer task (call once in the app `lifespan`)"""
+    global _queue, _task
+    _queue = Queue()
+    _task = create_task(_run())
+
+
+async def stop_writer():
+    """Commit anything still waiting in the queue, then stop the writer."""
+    global _queue, _task
+    if _queue is not None and _task is not None:
+        await _queue.put(None) # Stop signal (after the queued jobs)
+        await _task
+
+    _queue, _task = None, None
+
+
+async def write(*queries: Query) -> list:
+    """Run one or more write queries with the writer and return their rows.
+
+    > Multiple queries are one job: they're all written, or none of them are.
+    """
+    future = get_running_loop().create_future()
+    scope = request_scope.get() # So slow queries know their route
+
+    if _queue is None:
+        await _commit([(queries, future, scope)])
+        return await future
+
+    with measure("db", count=len(queries)): # The writer task has no timings of it's own
+        await _queue.put((queries, future, scope))
+        return await future
+
+
+async def _run():
+    """Drain the queue in batches forever (until we get the stop signal)"""
+    while True:
+        job = await _queue.get()
+        if job is None:
+            return
+
+        jobs, stopping = [job], False
+        while len(jobs) < BATCH_SIZE and not _queue.empty():
+            job = _queue.get_nowait()
+            if job is None:
+                stopping = True
+                break
+            jobs.append(job)
+
+        await _commit(jobs)
+
+        if stopping:
+            return
+
+
+async def _commit(jobs: list[tuple[tuple[Query, ...], Future, dict | None]]):
+    """Write a batch of jobs in one transaction (one savepoint per job)"""
+    jobs = [job for job in jobs if not job[1].done()]
+    results = []
+    start = time.perf_counter()
+
+    try:
+        async with Event._meta.db.transaction(TransactionType.immediate) as transaction:
+            before = await _generation()
+            metrics.lock_waited(time.perf_counter() - start) # We've got the lock
+            for queries, future, scope in jobs:
+                request_scope.set(scope)
+                savepoint = await transaction.savepoint()
+                try:
+                    rows = []
+                    for query in queries:
+                        rows += await query
+                    await savepoint.release()
+                    results.append((future, rows, None))
+                except Exception as error:
+                    await savepoint.rollback_to()
+                    results.append((future, None, error))
+            request_scope.set(None)
+            after = await _generation()
+    except Exception as error: # Nothing was committed
+        metrics.sqlite_error(error)
+        for _, future, _ in jobs:
+            if not future.done():
+                future.set_exception(error)
+        return
+
+    wrote(before, after)
+
+    for future, rows, error in results:
+        if future.done(): # The client gave up waiting
+            continue
+        elif error is None:
+            future.set_result(rows)
+        else:
+            future.set_exception(error)
+
+
+async def _generation() -> int:
+    rows = await Event.raw("SELECT n FROM planner_generation")
+    return rows[0]["n"]
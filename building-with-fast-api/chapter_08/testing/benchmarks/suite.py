@@ -0,0 +1,302 @@
+from pathlib import Path
+
+import os
+import tempfile
+
+# A temporary database (and a secret) BEFORE anything reads `piccolo_conf.py`
+DATABASE = Path(tempfile.mkdtemp()) / "benchmark.db"
+os.environ["SQLITE_DATABASE"] = str(DATABASE)
+os.environ.setdefault("SECRET_KEY", "benchmark-only-secret-key-not-for-production")
+
+from auth.authenticate import authenticate
+from auth.jwt_handler import create_access_token, verify_access_token
+from datetime import datetime, timezone
+from piccolo.apps.user.tables import BaseUser
+from piccolo.table import create_db_tables
+from planner import responses
+from planner.ids import parse_id, uuid7
+from planner.schema import create_schema
+from planner.tables import Event
+
+import argparse
+import asyncio
+import json
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+
+# ------------------------------------------------------------------------------
+#  Benchmarks for our hot paths (with baselines)
+# ==============================================================================
+# > `timeit` once is a guess. Timing the same thing before and after a change
+# > (on the same machine) is a measurement!
+#
+# Run it from `chapter_08` (it uses a temporary database, never `planner.db`):
+#
+# ```
+# python -m testing.benchmarks.suite                                    # Just run
+# python -m testing.benchmarks.suite --save testing/benchmarks/baselines/main.json
+# python -m testing.benchmarks.suite --compare testing/benchmarks/baselines/main.json
+# ```
+#
+# `--compare` exits with `1` if any benchmark's median is more than `--threshold`
+# percent slower than the baseline (10% by default), or a benchmark in the baseline
+# didn't run (that `--only` asked for), so it can fail a CI job. Use `--current`
+# to compare two saved files without running anything.
+#
+# 1. `jwt.*`: `create_access_token()` and `verify_access_token()`
+# 2. `auth.authenticate`: a valid token for an active (cached) user
+# 3. `db.*`: insert, select and delete an event through Piccolo (one connection
+#    per query, like our API)
+# 4. `serialise.*`: a list of 10, 1,000 and 100,000 events with orjson (see
+#    `planner/responses.py`)
+#
+#
+# Medians
+# -------
+# > The average is pulled about by the odd slow round (a GC, another process)
+#
+# Each benchmark runs `number` times per round, for a few rounds. We keep the time
+# per call for each round, and compare the MEDIAN round. Timings are only
+# comparable on the same machine (and Python, and SQLite version), so a baseline
+# saves those as well (`--compare` warns you if they're different).
+#
+# Baselines are per machine, so they're not committed (`baselines/` is yours).
+# A baseline from an older `VERSION` of this suite can't be compared (save a new
+# one). Version 1 timed `db.select_event` and `db.delete_event` with a `UUID`,
+# which never matches our `UUIDBLOB` column: a miss and a no-op!
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. Requests through the whole app (middleware and all) with `httpx`
+# 2. Run them in CI (a dedicated runner, or the numbers are noise)
+
+
+THRESHOLD = 10 # Percent slower than the baseline
+
+VERSION = 2 # Bump when a benchmark changes what it times (older baselines are refused)
+
+ROUNDS = 7
+
+
+def row(number: int, creator: int = 1) -> dict:
+    """An event shaped like Piccolo gives us (see `testing/serialise/benchmark.py`)"""
+    return {
+        "id": number,
+        "public_id": uuid7(),
+        "creator": creator,
+        "title": f"Event {number}",
+        "image": "https://example.com/image.jpg",
+        "description": "A fairly long description of the event. " * 10,
+        "location": "Brighton",
+        "tags": ["music", "adults"],
+        "latitude": 50.8225,
+        "longitude": -0.1372,
+    }
+
+
+# ------------------------------------------------------------------------------
+# Timing
+# ==============================================================================
+
+async def measure(function, number: int, rounds: int) -> list[float]:
+    """Seconds per call, for each round (`function` can be `async`)"""
+    timings = []
+
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            result = function()
+            if asyncio.iscoroutine(result):
+                await result
+        timings.append((time.perf_counter() - start) / number)
+
+    return timings
+
+
+def summary(timings: list[float], number: int) -> dict:
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "rounds": len(timings),
+        "number": number,
+    }
+
+
+# ------------------------------------------------------------------------------
+# Benchmarks
+# ==============================================================================
+
+async def benchmarks(rounds: int, only: list[str] | None) -> dict:
+    """Every benchmark (or those starting with one of `only`) as `{ name: summary }`"""
+    await create_db_tables(BaseUser, if_not_exists=True)
+    await create_schema()
+
+    user = await BaseUser.create_user(username="benchmark", password="benchmark-password", active=True)
+    token = create_access_token(user.username, user.id)
+    await authenticate(token) # Cache the user (that's the usual case)
+
+    async def insert():
+        await Event.insert(Event(creator=user.id, **event)).returning(*Event.all_columns())
+
+    async def select_page():
+        await Event.select(*Event.all_columns()).order_by(Event.id).limit(20)
+
+    async def select_event():
+        found = await Event.select(*Event.all_columns()).where(Event.public_id == public_id).first()
+        assert found is not None, "db.select_event didn't find it's event"
+
+    async def delete():
+        deleted = await Event.delete().where(Event.public_id == public_ids.pop()).returning(Event.id)
+        assert deleted, "db.delete_event didn't delete anything"
+
+    event = {key: value for key, value in row(0).items() if key not in ("id", "public_id", "creator")}
+    public_id = None # `UUIDBLOB` bytes, like our routes use (a `UUID` never matches)
+    public_ids = []
+
+    async def setup_select():
+        nonlocal public_id
+        rows = await Event.insert(Event(creator=user.id, **event)).returning(Event.public_id)
+        public_id = parse_id(rows[0]["public_id"]).bytes
+
+    async def setup_delete(count: int):
+        rows = await Event.insert(*(Event(creator=user.id, **event) for _ in range(count))).returning(Event.public_id)
+        public_ids.extend(parse_id(row["public_id"]).bytes for row in rows)
+
+    pages = {size: [row(number) for number in range(size)] for size in (10, 1000, 100_000)}
+
+    def serialise(size: int):
+        return lambda: responses.dumps({"events": responses.events(pages[size]), "next": None})
+
+    cases = [
+        ("jwt.create_access_token", lambda: create_access_token(user.username, user.id), 2000, None),
+        ("jwt.verify_access_token", lambda: verify_access_token(token), 2000, None),
+        ("auth.authenticate", lambda: authenticate(token), 2000, None),
+        ("db.insert_event", insert, 100, None),
+        ("db.select_page", select_page, 200, None),
+        ("db.select_event", select_event, 200, setup_select),
+        ("db.delete_event", delete, 100, lambda: setup_delete(100 * rounds)),
+        ("serialise.events_10", serialise(10), 2000, None),
+        ("serialise.events_1k", serialise(1000), 20, None),
+        ("serialise.events_100k", serialise(100_000), 1, None),
+    ]
+
+    results = {}
+    for name, function, number, setup in cases:
+        if only and not name.startswith(tuple(only)):
+            continue
+        if setup is not None:
+            await setup()
+
+        results[name] = summary(await measure(function, number, rounds), number)
+        print(f"{name:<28} {_format(results[name]['median'])}", file=sys.stderr)
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+# Baselines
+# ==============================================================================
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "node": platform.node(),
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float, only: list[str] | None = None) -> list[str]:
+    """Print a table of changes, and return the names that got too slow (or are missing).
+
+    > A baseline benchmark that's not in `current` is missing, unless `--only`
+    > left it out on purpose.
+    """
+    if baseline["environment"] != current["environment"]:
+        print(f"⚠️ Different machines! {baseline['environment']} vs {current['environment']}")
+
+    regressions = []
+    print(f"{'Benchmark':<28} {'Baseline':>12} {'Current':>12} {'Change':>8}")
+
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<28} {'(new)':>12} {_format(result['median']):>12}")
+            continue
+
+        change = (result["median"] - before["median"]) / before["median"] * 100
+        slower = change > threshold
+        print(
+            f"{name:<28} {_format(before['median']):>12} {_format(result['median']):>12} "
+            f"{change:>+7.1f}% {'❌' if slower else ''}"
+        )
+        if slower:
+            regressions.append(name)
+
+    for name, before in baseline["results"].items():
+        if name in current["results"] or (only and not name.startswith(tuple(only))):
+            continue
+        print(f"{name:<28} {_format(before['median']):>12} {'(missing)':>12} {'':>8} ❌")
+        regressions.append(name)
+
+    return regressions
+
+
+def _format(seconds: float) -> str:
+    if seconds >= 0.001:
+        return f"{seconds * 1000:.2f}ms"
+    return f"{seconds * 1_000_000:.1f}µs"
+
+
+def run(rounds: int, only: list[str] | None) -> dict:
+    try:
+        results = asyncio.run(benchmarks(rounds, only))
+    finally:
+        shutil.rmtree(DATABASE.parent, ignore_errors=True)
+
+    return {
+        "version": VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "environment": environment(),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the planner's hot paths")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--only", help="Comma separated prefixes (`jwt,db.select`)")
+    parser.add_argument("--save", help="Save the results as a baseline (JSON)")
+    parser.add_argument("--compare", help="A baseline to compare against (fails if slower)")
+    parser.add_argument("--current", help="Compare this saved file, rather than running")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Percent")
+    args = parser.parse_args()
+
+    only = args.only.split(",") if args.only else None
+    current = json.loads(Path(args.current).read_text()) if args.current else run(args.rounds, only)
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(current, indent=2))
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline.get("version", 1) != current.get("version", 1):
+            print(
+                f"❌ Can't compare version {baseline.get('version', 1)} of this suite with "
+                f"version {current.get('version', 1)} (save a new baseline)"
+            )
+            sys.exit(1)
+
+        regressions = compare(baseline, current, args.threshold, only)
+        if regressions:
+            print(f"Slower than the baseline (by more than {args.threshold}%), or missing: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,423 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from decouple import config
+from pathlib import Path
+
+import argparse
+import asyncio
+import httpx
+import json
+import random
+import sqlite3
+import time
+import uuid
+
+# ------------------------------------------------------------------------------
+#  A load generator (mixed reads and writes)
+# ==============================================================================
+# > Bombardier can only hit one endpoint, with a JWT you've copied from Bruno.
+# > This one signs itself in, and mixes reads and writes like real users do.
+#
+# Run the API in one terminal, and this in another (both from `chapter_08`):
+#
+# ```
+# uvicorn main:app --timeout-keep-alive 10
+# python -m testing.load.generator --concurrency 50 --duration 30
+# python -m testing.load.generator --rate 200 --duration 30 --mix list=70,get=20,create=10
+# ```
+#
+# 1. Signs up (or in) `--users` test users with `/users/signup` and `/users/signin`
+# 2. Creates `--seed` events, so there's something to `GET` and `DELETE`
+# 3. Runs the `--mix` of scenarios for `--duration` seconds
+# 4. Prints throughput, latency percentiles and errors (per scenario)
+# 5. Checks every write against the database (see "Reconciliation" below)
+#
+#
+# Scenarios
+# ---------
+# > `--mix list=60,get=25,create=10,delete=5` (the weights, not percentages)
+#
+# 1. `list`: `GET /events/` (the first page)
+# 2. `get`: `GET /events/{id}` (an event this run created)
+# 3. `create`: `POST /events/` (a unique `title`, so we can find it later)
+# 4. `delete`: `DELETE /events/{id}` (an event this run created)
+#
+#
+# Fixed concurrency or fixed rate
+# -------------------------------
+# > Bombardier's `-c 125` is a CLOSED loop: a slow server gets fewer requests.
+#
+# 1. `--concurrency 50`: 50 users, each sends a request as soon as the last one
+#    comes back (the same as bombardier)
+# 2. `--rate 200`: 200 requests a second, whether the server keeps up or not (an
+#    OPEN loop, like real traffic)
+#
+# With `--rate`, latency is measured from when the request SHOULD have been sent.
+# Otherwise a server that stalls for 5 seconds hides most of that stall from us
+# ("coordinated omission"). `--max-in-flight` stops us eating all our own memory
+# if the server stops answering (those requests are counted as `skipped`).
+#
+# Connections are limited to `--max-in-flight` (with `--rate`) or `--concurrency`,
+# so a request never waits for one in `httpx` (which would quietly close the loop
+# again). If one does wait longer than `--timeout`, the server never saw it: it's
+# a `pool timeout`, NOT one of the server's errors.
+#
+#     @ https://www.scylladb.com/2021/04/22/on-coordinated-omission/
+#
+#
+# Reconciliation
+# --------------
+# > "Inserts can still happen even if database locked or timeout errors!"
+# > (see `testing/bombardier/README.md`)
+#
+# Every `create` has a title like `load a1b2c3 42` (the run, then a number), so
+# after the run we read the database (`--database`, read only) and compare:
+#
+# 1. `inserted despite error`: a `5xx` (or timeout) but the row IS there
+# 2. `missing`: a `2xx` but the row is NOT there (that's a real bug!)
+# 3. `deleted despite error`: a failed `DELETE`, but the row is gone
+# 4. `not deleted`: a `2xx` `DELETE`, but the row is still there (also a bug)
+#
+# Use the same `SQLITE_DATABASE` as the API (the default is `planner.db`). The
+# events are left in the database, so you can look at them:
+#
+# ```
+# DELETE FROM event WHERE title LIKE 'load %';
+# ```
+#
+#
+# ------------------------------------------------------------------------------
+# WISHLIST
+# ------------------------------------------------------------------------------
+# 1. `POST /events/bulk` and `GET /events/search` scenarios
+# 2. Ramp the rate up over time (to find where it falls over)
+
+
+SCENARIOS = ("list", "get", "create", "delete")
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+PASSWORD = "load-test-password"
+SIGN_IN_TIMEOUT = 30 # Seconds (hashing is slow on purpose, see `auth/passwords.py`)
+
+
+@dataclass
+class Run:
+    """Everything we've seen so far (we're one event loop, so no locks)"""
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:6])
+    tokens: list = field(default_factory=list)
+    events: list = field(default_factory=list) # `public_id`s we can `GET` or `DELETE`
+    latencies: dict = field(default_factory=lambda: {name: [] for name in SCENARIOS})
+    statuses: dict = field(default_factory=lambda: {name: Counter() for name in SCENARIOS})
+    created: dict = field(default_factory=dict) # title: "ok" | "error"
+    deleted: dict = field(default_factory=dict) # public_id: ("ok" | "error", title)
+    titles: dict = field(default_factory=dict) # public_id: title
+    owners: dict = field(default_factory=dict) # public_id: token (of it's creator)
+    skipped: int = 0
+    pool_timeouts: int = 0 # Never sent (no free connection in time)
+    count: int = 0
+
+
+# ------------------------------------------------------------------------------
+# Scenarios
+# ==============================================================================
+
+async def list_events(client: httpx.AsyncClient, run: Run) -> httpx.Response:
+    return await client.get("/events/", headers=_auth(random.choice(run.tokens)))
+
+
+async def get_event(client: httpx.AsyncClient, run: Run) -> httpx.Response:
+    if not run.events:
+        return await list_events(client, run)
+    return await client.get(f"/events/{random.choice(run.events)}", headers=_auth(random.choice(run.tokens)))
+
+
+async def create_event(client: httpx.AsyncClient, run: Run) -> httpx.Response:
+    run.count += 1
+    title = f"load {run.id} {run.count}"
+    run.created[title] = "error" # Until we hear otherwise
+    token = random.choice(run.tokens)
+
+    response = await client.post("/events/", headers=_auth(token), json={
+        "title": title,
+        "image": "https://example.com/image.jpg",
+        "description": "Created by the load generator (see `testing/load`)",
+        "location": "Brighton",
+        "tags": ["load"],
+    })
+
+    if response.status_code < 300:
+        public_id = response.json()["public_id"]
+        run.created[title] = "ok"
+        run.titles[public_id] = title
+        run.owners[public_id] = token
+        run.events.append(public_id)
+
+    return response
+
+
+async def delete_event(client: httpx.AsyncClient, run: Run) -> httpx.Response:
+    if not run.events:
+        return await create_event(client, run)
+
+    public_id = run.events.pop(random.randrange(len(run.events))) # Only delete once
+    run.deleted[public_id] = ("error", run.titles[public_id])
+
+    # Only the creator can delete an event, so use the token that created it
+    response = await client.delete(f"/events/{public_id}", headers=_auth(run.owners[public_id]))
+
+    if response.status_code < 300:
+        run.deleted[public_id] = ("ok", run.titles[public_id])
+
+    return response
+
+
+SCENARIO_FUNCTIONS = {
+    "list": list_events,
+    "get": get_event,
+    "create": create_event,
+    "delete": delete_event,
+}
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+# ------------------------------------------------------------------------------
+# Running
+# ==============================================================================
+
+async def sign_in(client: httpx.AsyncClient, username: str) -> str:
+    """A fresh token for `username` (signed up first, if they're new)"""
+    await client.post("/users/signup", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": PASSWORD,
+    }, timeout=SIGN_IN_TIMEOUT) # A `409` is fine (they already exist)
+
+    response = await client.post("/users/signin", data={
+        "username": username,
+        "password": PASSWORD,
+    }, timeout=SIGN_IN_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def request(client: httpx.AsyncClient, run: Run, scenario: str, start: float):
+    """Run one scenario, timed from `start` (when it should have been sent)"""
+    try:
+        response = await SCENARIO_FUNCTIONS[scenario](client, run)
+        outcome = str(response.status_code)
+    except httpx.PoolTimeout:
+        run.pool_timeouts += 1 # Our fault, not the server's
+        return
+    except httpx.HTTPError as error:
+        outcome = type(error).__name__ # `ReadTimeout`, `ConnectError`, etc
+
+    run.latencies[scenario].append(time.perf_counter() - start)
+    run.statuses[scenario][outcome] += 1
+
+
+async def closed_loop(client: httpx.AsyncClient, run: Run, pick, concurrency: int, until: float):
+    """`concurrency` users, each sending their next request straight away"""
+    async def user():
+        while time.perf_counter() < until:
+            await request(client, run, pick(), time.perf_counter())
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+
+
+async def open_loop(client: httpx.AsyncClient, run: Run, pick, rate: float, until: float, max_in_flight: int):
+    """`rate` requests a second, on schedule (however slow the server gets)"""
+    in_flight: set[asyncio.Task] = set()
+    start = time.perf_counter()
+    sent = 0
+
+    while True:
+        scheduled = start + sent / rate
+        if scheduled >= until:
+            break
+
+        await asyncio.sleep(max(scheduled - time.perf_counter(), 0))
+        sent += 1
+
+        if len(in_flight) >= max_in_flight:
+            run.skipped += 1
+            continue
+
+        task = asyncio.create_task(request(client, run, pick(), scheduled))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    await asyncio.gather(*in_flight)
+
+
+def picker(mix: dict[str, int]):
+    names, weights = list(mix), list(mix.values())
+    return lambda: random.choices(names, weights)[0]
+
+
+async def main(args) -> dict:
+    run = Run()
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.max_in_flight if args.rate else args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=timeout, limits=limits) as client:
+        run.tokens = [await sign_in(client, f"load{number}") for number in range(args.users)]
+
+        for _ in range(args.seed):
+            await create_event(client, run)
+
+        run.statuses = {name: Counter() for name in SCENARIOS} # Don't count the seed
+        started = time.perf_counter()
+        until = started + args.duration
+
+        if args.rate:
+            await open_loop(client, run, picker(args.mix), args.rate, until, args.max_in_flight)
+        else:
+            await closed_loop(client, run, picker(args.mix), args.concurrency, until)
+
+        elapsed = time.perf_counter() - started
+
+    return report(run, elapsed, args)
+
+
+# ------------------------------------------------------------------------------
+# Results
+# ==============================================================================
+
+def report(run: Run, elapsed: float, args) -> dict:
+    scenarios = {}
+    for name in SCENARIOS:
+        latencies = sorted(run.latencies[name])
+        if not latencies:
+            continue
+        scenarios[name] = {
+            "requests": len(latencies),
+            "statuses": dict(run.statuses[name]),
+            "latency_ms": {f"p{p}": percentile(latencies, p) * 1000 for p in PERCENTILES},
+        }
+
+    total = sum(len(latencies) for latencies in run.latencies.values())
+    ok = sum(
+        count for counter in run.statuses.values()
+        for status, count in counter.items() if status.startswith("2")
+    )
+    everything = sorted(latency for latencies in run.latencies.values() for latency in latencies)
+
+    return {
+        "run": run.id,
+        "mode": f"rate {args.rate}/s" if args.rate else f"concurrency {args.concurrency}",
+        "seconds": elapsed,
+        "requests": total,
+        "requests_per_second": total / elapsed,
+        "ok_per_second": ok / elapsed,
+        "skipped": run.skipped,
+        "pool_timeouts": run.pool_timeouts,
+        "latency_ms": {f"p{p}": percentile(everything, p) * 1000 for p in PERCENTILES} if everything else {},
+        "errors": errors(run),
+        "scenarios": scenarios,
+        "reconciliation": reconcile(run, args.database),
+    }
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    """Nearest rank (so p99 of 100 requests is the 99th slowest)"""
+    rank = max(int(len(ordered) * p / 100 + 0.999999) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def errors(run: Run) -> dict:
+    """Everything that wasn't a `2xx`, by class (`5xx`, `ReadTimeout`, etc)"""
+    classes = Counter()
+    for counter in run.statuses.values():
+        for status, count in counter.items():
+            if status.isdigit():
+                if not status.startswith("2"):
+                    classes[f"{status[0]}xx ({status})"] += count
+            else:
+                classes[status] += count
+    return dict(classes)
+
+
+def reconcile(run: Run, database: str) -> dict:
+    """Compare what the API told us with what's actually in the database"""
+    path = Path(database)
+    if not path.exists():
+        return {"skipped": f"No database at {database}"}
+
+    connection = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        rows = connection.execute(
+            "SELECT title FROM event WHERE title LIKE ?", (f"load {run.id} %",)
+        ).fetchall()
+    finally:
+        connection.close()
+
+    in_database = {title for (title,) in rows}
+    deleted_ok = {title for outcome, title in run.deleted.values() if outcome == "ok"}
+    deleted_error = {title for outcome, title in run.deleted.values() if outcome == "error"}
+
+    return {
+        "created": sum(outcome == "ok" for outcome in run.created.values()),
+        "in_database": len(in_database),
+        "inserted_despite_error": len({
+            title for title, outcome in run.created.items() if outcome == "error"
+        } & in_database),
+        "missing": len({
+            title for title, outcome in run.created.items() if outcome == "ok"
+        } - deleted_ok - deleted_error - in_database),
+        "deleted_despite_error": len(deleted_error - in_database),
+        "not_deleted": len(deleted_ok & in_database),
+    }
+
+
+def print_report(results: dict):
+    print(f"Run {results['run']} ({results['mode']}) for {results['seconds']:.1f}s")
+    print(f"  Requests   {results['requests']} ({results['requests_per_second']:.1f}/s, "
+          f"{results['ok_per_second']:.1f}/s ok, {results['skipped']} skipped, "
+          f"{results['pool_timeouts']} pool timeouts)")
+    print("  Latency    " + _latencies(results["latency_ms"]))
+    print(f"  Errors     {results['errors'] or 'none'}")
+
+    for name, scenario in results["scenarios"].items():
+        print(f"  {name:<10} {scenario['requests']:>7}  {_latencies(scenario['latency_ms'])}  {scenario['statuses']}")
+
+    print(f"  Database   {results['reconciliation']}")
+
+
+def _latencies(latencies: dict) -> str:
+    return "  ".join(f"{name} {value:.1f}ms" for name, value in latencies.items())
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name} (try {', '.join(SCENARIOS)})")
+        weights[name.strip()] = int(weight or 1)
+    return weights
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mixed read/write load for the planner API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=1, help="Test users (load0, load1 ...)")
+    parser.add_argument("--seed", type=int, default=20, help="Events to create before the run")
+    parser.add_argument("--mix", type=parse_mix, default="list=60,get=25,create=10,delete=5")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds")
+    parser.add_argument("--concurrency", type=int, default=10, help="Users sending requests back to back")
+    parser.add_argument("--rate", type=float, help="Requests a second instead (an open loop)")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="With --rate (and our connection limit)")
+    parser.add_argument("--timeout", type=float, default=10, help="Seconds (like bombardier's -t)")
+    parser.add_argument("--database", default=config("SQLITE_DATABASE", default="planner.db"))
+    parser.add_argument("--json", help="Save the results to this file as well")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    print_report(results)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
@@ -0,0 +1,74 @@
+from planner import responses
+from planner.ids import uuid7
+from planner.models.events import EventPage
+from pydantic import TypeAdapter
+
+import json
+import timeit
+
+# ------------------------------------------------------------------------------
+#  Test the speed of serialising a page of events
+# ==============================================================================
+# > TLDR; orjson is roughly 2.5x quicker than a `response_model=` (see below)
+# > Run it from `chapter_08`: `python -m testing.serialise.benchmark`
+#
+# @ https://fastapi.tiangolo.com/advanced/response-directly/
+# @ https://github.com/ijl/orjson#performance
+#
+# 1. `response_model=` is what FastAPI does for us: validate every row with the
+#    model, dump it back into a dict, then `json.dumps()` it (`JSONResponse`)
+# 2. `orjson` is what our read routes do (see `planner/responses.py`)
+#
+# Our rows are shaped like the ones Piccolo gives us (including the `id` and
+# `creator` that must NOT be sent). Results on my machine (per page):
+#
+# | Events | `response_model=` | orjson  |
+# | ------ | ----------------- | ------- |
+# | 20     | 0.28ms            | 0.11ms  |
+# | 100    | 1.38ms            | 0.58ms  |
+#
+# Most of what's left is `to_base62()` (it's in both, see `planner/ids.py`).
+
+
+loop = 1000 # Number of times the function is run
+
+adapter = TypeAdapter(EventPage)
+
+
+def rows(count: int) -> list[dict]:
+    return [
+        {
+            "id": number,
+            "public_id": uuid7(),
+            "creator": 1,
+            "title": f"Event {number}",
+            "image": "https://example.com/image.jpg",
+            "description": "A fairly long description of the event. " * 10,
+            "location": "Brighton",
+            "tags": ["music", "adults"],
+            "latitude": 50.8225,
+            "longitude": -0.1372,
+        }
+        for number in range(count)
+    ]
+
+
+def response_model(page: list[dict]) -> bytes:
+    content = adapter.dump_python(adapter.validate_python({"events": page, "next": None}), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def fast_path(page: list[dict]) -> bytes:
+    return responses.dumps({"events": responses.events(page), "next": None})
+
+
+# They must say the same thing (and never leak the `creator`)
+assert json.loads(response_model(rows(5))).keys() == json.loads(fast_path(rows(5))).keys()
+assert "creator" not in fast_path(rows(1)).decode()
+
+for count in (20, 100):
+    page = rows(count)
+    print(f"{count} events")
+    print(f"response_model= {timeit.timeit(lambda: response_model(page), number=loop) / loop * 1000:.3f}ms")
+    print(f"orjson          {timeit.timeit(lambda: fast_path(page), number=loop) / loop * 1000:.3f}ms")
+    print("-------------------------")
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import os
+import tempfile
+
+# A temporary database (and a secret) BEFORE anything reads `piccolo_conf.py`
+DATABASE = Path(tempfile.mkdtemp()) / "test.db"
+os.environ["SQLITE_DATABASE"] = str(DATABASE)
+os.environ.setdefault("SECRET_KEY", "test-only-secret-key-not-for-production")
+
+from fastapi.testclient import TestClient
+from piccolo.apps.user.tables import BaseUser
+
+import pytest
+import shutil
+
+# ------------------------------------------------------------------------------
+#  Tests (run them from `chapter_08`)
+# ==============================================================================
+# > `python -m pytest -q tests`
+#
+# Every test shares one temporary database (never `planner.db`), so give your
+# events tags (or titles) of their own, and only look for those.
+
+
+@pytest.fixture(scope="session")
+def client():
+    BaseUser.create_table(if_not_exists=True).run_sync()
+    BaseUser.create_user_sync(username="tester", password="test-password", active=True)
+
+    from main import app
+
+    with TestClient(app) as client:
+        yield client
+
+    shutil.rmtree(DATABASE.parent, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def headers(client) -> dict:
+    response = client.post("/users/signin", data={"username": "tester", "password": "test-password"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,29 @@
+from planner.tables import Event
+
+
+def titles(client, params: dict) -> list[str]:
+    """Every page of `GET /events/` (one event at a time, so we use the cursors)"""
+    seen, cursor = [], None
+
+    while True:
+        response = client.get("/events/", params={**params, "limit": 1, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        seen += [event["title"] for event in response.json()["events"]]
+        cursor = response.json()["next"]
+        if cursor is None:
+            return seen
+
+
+def test_null_sort_cursor_with_tags(client):
+    """A `NULL` location cursor is still filtered by `?tag=` (on every page)"""
+    Event.insert(*(
+        Event(creator=None, title=title, image="i", description="d", location=location, tags=tags)
+        for title, location, tags in [
+            ("Null music", None, ["cursor-music"]),
+            ("Null other", None, ["cursor-other"]),
+            ("Brighton music", "Brighton", ["cursor-music"]),
+            ("Zurich other", "Zurich", ["cursor-other"]),
+        ]
+    )).run_sync() # No location is only possible outside of our API
+
+    assert titles(client, {"q": "location", "tag": "cursor-music"}) == ["Null music", "Brighton music"]
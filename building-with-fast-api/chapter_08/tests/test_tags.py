@@ -0,0 +1,36 @@
+from planner.tags import normalise
+
+import pytest
+
+
+def titles(client, tag: str) -> list[str]:
+    response = client.get("/events/", params={"tag": tag})
+    assert response.status_code == 200, response.text
+    return [event["title"] for event in response.json()["events"]]
+
+
+@pytest.mark.parametrize("tag", ["\ttag-padded\n", " Tag-Padded\r\n"])
+def test_whitespace_padded_tags(client, headers, tag):
+    """The triggers and `?tag=` trim tabs and newlines the same way"""
+    title = f"Padded {tag!r}"
+    response = client.post("/events/", headers=headers, json={
+        "title": title, "image": "i", "description": "d", "location": "l", "tags": [tag],
+    })
+    assert response.status_code == 200, response.text
+
+    assert title in titles(client, "tag-padded")
+    assert title in titles(client, tag)
+
+
+def test_unicode_tags(client, headers):
+    response = client.post("/events/", headers=headers, json={
+        "title": "Oktoberfest", "image": "i", "description": "d", "location": "l", "tags": ["MÜNCHEN"],
+    })
+    assert response.status_code == 200, response.text
+
+    assert titles(client, "MÜNCHEN") == titles(client, "münchen") == ["Oktoberfest"]
+
+
+def test_normalise():
+    """Only `WHITESPACE` is trimmed (a non-breaking space isn't, like the triggers)"""
+    assert normalise(["Music\t", "\nmusic", " \r\n", "\u00a0jazz"]) == ("music", "\u00a0jazz")